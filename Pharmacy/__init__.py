@@ -1,4 +1,4 @@
-# # myproject/__init__.py
-# from .celery import app as celery_app
+# Load the Celery app with Django so @shared_task binds to it
+from .celery import app as celery_app
 
-# __all__ = ('celery_app',)
+__all__ = ('celery_app',)
@@ -0,0 +1,10 @@
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Pharmacy.settings')
+
+app = Celery('Pharmacy')
+# every CELERY_* setting in settings.py configures the app
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
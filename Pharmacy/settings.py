@@ -11,7 +11,9 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+import sys
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -24,6 +26,7 @@ load_dotenv()
 SECRET_KEY = os.getenv('DJANGO_SECRET_KEY')
 APPEND_SLASH=True
 DEBUG = os.getenv('DJANGO_DEBUG').lower() == 'true'
+TESTING = sys.argv[1:2] == ['test']
 if not DEBUG:
     ALLOWED_HOSTS = os.getenv('DJANGO_ALLOWED_HOSTS').split(',')
 else:
@@ -51,12 +54,14 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'core.apps.CoreConfig',
     'rest_framework.authtoken',
     'django_filters',
     'rest_framework',
     'django.contrib.sitemaps',
     'pwa',
+    'channels',
 ]
 
 MIDDLEWARE = [
@@ -82,12 +87,50 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'core.context_processors.supplier_profile',
             ],
         },
     },
 ]
 
 WSGI_APPLICATION = 'Pharmacy.wsgi.application'
+ASGI_APPLICATION = 'Pharmacy.asgi.application'
+
+
+# Channels (WebSocket push for chat and notifications)
+# The in-memory layer only reaches sockets held by the same process; set CHANNEL_LAYER_BACKEND
+# (e.g. channels_redis.core.RedisChannelLayer) and CHANNEL_LAYER_HOSTS when running several workers
+
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': os.getenv('CHANNEL_LAYER_BACKEND', 'channels.layers.InMemoryChannelLayer'),
+    }
+}
+if os.getenv('CHANNEL_LAYER_HOSTS'):
+    CHANNEL_LAYERS['default']['CONFIG'] = {'hosts': os.getenv('CHANNEL_LAYER_HOSTS').split(',')}
+
+
+# Cache
+# Per-process memory by default. Both caches hold state every process must agree on (unread
+# counters, supplier headers, presence, the catalog version), so point them at a shared backend
+# (e.g. Redis) when running several workers; `manage.py check --deploy` warns otherwise
+# (core.W001, core.W003)
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('DJANGO_CACHE_LOCATION', ''),
+    },
+    # cached anonymous catalog pages (core.catalog.CatalogCache) and the catalog version and
+    # timestamp behind the API's ETag/Last-Modified. With more than one web process this must
+    # be a shared backend (e.g. CATALOG_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache,
+    # CATALOG_CACHE_LOCATION=redis://redis:6379/2); `manage.py check --deploy` warns otherwise
+    'catalog': {
+        'BACKEND': os.getenv('CATALOG_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CATALOG_CACHE_LOCATION', 'catalog'),
+    },
+}
+CATALOG_CACHE_ALIAS = os.getenv('CATALOG_CACHE_ALIAS', 'catalog')
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', '300'))
 
 
 # Database
@@ -133,6 +176,78 @@ if not DEBUG:
 
 
 
+# Supplier "last seen": each user is written at most once per interval (seconds), in bulk.
+# The web processes journal the timestamps in the default cache. With a shared default cache
+# the `flush-last-activity` beat task writes them every interval; with the per-process
+# LocMemCache the worker cannot see them, so by default each web process flushes its own from
+# a background thread (LAST_ACTIVITY_BACKGROUND_FLUSH). The thread never runs under
+# `manage.py test`, and `check --deploy` warns when nothing can flush (core.W002).
+LAST_ACTIVITY_INTERVAL = int(os.getenv('LAST_ACTIVITY_INTERVAL', '60'))
+LAST_ACTIVITY_BACKGROUND_FLUSH = os.getenv(
+    'LAST_ACTIVITY_BACKGROUND_FLUSH', str(CACHES['default']['BACKEND'].endswith('LocMemCache')),
+).lower() == 'true' and not TESTING
+
+# Read notifications older than this many days are removed by `manage.py prune_notifications`
+NOTIFICATION_RETENTION_DAYS = int(os.getenv('NOTIFICATION_RETENTION_DAYS', '90'))
+
+
+# Celery
+# Production sets CELERY_BROKER_URL (e.g. redis://redis:6379/0) and runs a worker; without
+# DEBUG the site refuses to start without it, since the in-memory broker would accept tasks
+# that no worker ever runs. Tasks run eagerly inside the caller only in DEBUG and under
+# `manage.py test`, unless CELERY_TASK_ALWAYS_EAGER says otherwise
+
+CELERY_TASK_ALWAYS_EAGER = os.getenv('CELERY_TASK_ALWAYS_EAGER', str(DEBUG or TESTING)).lower() == 'true'
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL')
+if not CELERY_BROKER_URL:
+    if not (DEBUG or TESTING or CELERY_TASK_ALWAYS_EAGER):
+        raise ImproperlyConfigured("Set CELERY_BROKER_URL (e.g. redis://redis:6379/0) when DEBUG is off.")
+    CELERY_BROKER_URL = 'memory://'
+CELERY_TASK_EAGER_PROPAGATES = True
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_TIMEZONE = 'UTC'
+# `celery -A Pharmacy beat` checks for suppliers due a Telegram post (see core.tasks)
+CELERY_BEAT_SCHEDULE = {
+    'post-due-suppliers': {
+        'task': 'core.tasks.post_next_supplier_products',
+        'schedule': float(os.getenv('TELEGRAM_SCHEDULE_INTERVAL', '60')),
+    },
+    'flush-last-activity': {
+        'task': 'core.tasks.flush_last_activity',
+        'schedule': float(LAST_ACTIVITY_INTERVAL),
+    },
+}
+
+
+# Public address of the site, used for links in content published elsewhere (Telegram posts)
+SITE_URL = os.getenv('SITE_URL', 'http://127.0.0.1:8000').rstrip('/')
+
+
+# Telegram publishing (core.telegram_utils / core.tasks)
+# Telegram allows about 30 messages a second per bot and 20 a minute per group, so sends are
+# spaced by TELEGRAM_GLOBAL_INTERVAL overall and TELEGRAM_PER_CHAT_INTERVAL per chat (seconds)
+
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org')
+TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_BOT_ID')  # suppliers group
+TELEGRAM_CHANNEL_ID = os.getenv('TELEGRAM_CHANNEL_BOT_ID')
+TELEGRAM_MAX_WORKERS = int(os.getenv('TELEGRAM_MAX_WORKERS', '4'))
+TELEGRAM_GLOBAL_INTERVAL = float(os.getenv('TELEGRAM_GLOBAL_INTERVAL', str(1 / 30)))
+TELEGRAM_PER_CHAT_INTERVAL = float(os.getenv('TELEGRAM_PER_CHAT_INTERVAL', '3'))
+TELEGRAM_MAX_RETRIES = int(os.getenv('TELEGRAM_MAX_RETRIES', '4'))
+TELEGRAM_RETRY_BACKOFF = float(os.getenv('TELEGRAM_RETRY_BACKOFF', '1'))
+
+# core.* logs (Telegram runs, import jobs, catalog cache hit rates) go to the console
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {'console': {'class': 'logging.StreamHandler'}},
+    'loggers': {
+        'core': {'handlers': ['console'], 'level': os.getenv('CORE_LOG_LEVEL', 'WARNING' if TESTING else 'INFO')},
+    },
+}
+
 # Password validation MvKl1O3ilxZhfnz7
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -23,13 +23,8 @@ from django.conf.urls import handler404
 
 handler404 = 'core.views.handler404'
 
-from django.contrib.sitemaps.views import sitemap
-from core.sitemaps import StaticViewSitemap, SupplierSitemap
+from core.sitemaps import cached_sitemap
 from core.views import robots_txt
-sitemaps = {
-    'static': StaticViewSitemap,
-    'detail':SupplierSitemap
-}
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -41,7 +36,8 @@ urlpatterns = [
     path('terms/', TemplateView.as_view(template_name='terms.html'), name='terms-policy'),
 
     path("robots.txt", robots_txt, name="robots_txt"),
-    path("sitemap.xml", sitemap, {"sitemaps": sitemaps}, name="sitemap"),
+    path("sitemap.xml", cached_sitemap, name="sitemap"),
+    path("sitemap-<section>.xml", cached_sitemap, name="sitemap-section"),
 
 ]
 
@@ -0,0 +1,193 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+from .models import Supplier
+
+logger = logging.getLogger(__name__)
+
+# Timestamps waiting to be written are journalled in the cache: PENDING_SEQ_KEY counts the
+# entries appended, FLUSHED_KEY is the last one written to the database
+PENDING_SEQ_KEY = 'activity:seq'
+FLUSHED_KEY = 'activity:flushed'
+PENDING_TIMEOUT = 24 * 3600
+
+
+def presence_cache_key(user_id):
+    return f"presence:{user_id}"
+
+
+def pending_cache_key(seq):
+    return f"activity:pending:{seq}"
+
+
+def gap_cache_key(seq):
+    # when flush() first found entry `seq` missing
+    return f"activity:gap:{seq}"
+
+
+class ActivityTracker:
+    """
+    Records "last seen" timestamps and writes them to Supplier.last_activity in bulk. Each
+    user is recorded at most once per interval per process. Timestamps are published to the
+    cache, both for presence and as a journal that flush() drains with a single UPDATE, so
+    the flush can run in another process: the `flush_last_activity` beat task, or a
+    background thread when LAST_ACTIVITY_BACKGROUND_FLUSH is set. Like presence, this needs
+    a cache shared by the web and worker processes.
+    """
+
+    def __init__(self, interval=None):
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._recorded = {}  # user id -> last time recorded by this process
+        self._pruned_at = timezone.now()
+        self._flusher = None
+
+    @property
+    def interval(self):
+        if self._interval is not None:
+            return self._interval
+        return getattr(settings, 'LAST_ACTIVITY_INTERVAL', 60)
+
+    def record(self, user_id, now=None):
+        now = now or timezone.now()
+        with self._lock:
+            last = self._recorded.get(user_id)
+            if last is not None and (now - last).total_seconds() < self.interval:
+                return False
+            self._recorded[user_id] = now
+            self._prune(now)
+        cache.set(presence_cache_key(user_id), now, self.interval * 10)
+        cache.add(PENDING_SEQ_KEY, 0, None)
+        try:
+            seq = cache.incr(PENDING_SEQ_KEY)
+        except ValueError:  # evicted since the add
+            cache.add(PENDING_SEQ_KEY, 0, None)
+            seq = cache.incr(PENDING_SEQ_KEY)
+        cache.set(pending_cache_key(seq), (user_id, now), PENDING_TIMEOUT)
+        self._ensure_flusher()
+        return True
+
+    def _prune(self, now):
+        # forget users not seen for an interval, at most once an interval; called with the lock held
+        if (now - self._pruned_at).total_seconds() < self.interval:
+            return
+        self._pruned_at = now
+        self._recorded = {
+            uid: ts for uid, ts in self._recorded.items()
+            if (now - ts).total_seconds() < self.interval
+        }
+
+    def last_seen(self, user_id):
+        """Most recent timestamp recorded by this process or published to the cache, or None."""
+        with self._lock:
+            seen = self._recorded.get(user_id)
+        return seen or cache.get(presence_cache_key(user_id))
+
+    def last_seen_many(self, user_ids):
+        user_ids = set(user_ids)
+        with self._lock:
+            seen = {uid: self._recorded[uid] for uid in user_ids if uid in self._recorded}
+        missing = user_ids - seen.keys()
+        if missing:
+            cached = cache.get_many([presence_cache_key(uid) for uid in missing])
+            for uid in missing:
+                value = cached.get(presence_cache_key(uid))
+                if value is not None:
+                    seen[uid] = value
+        return seen
+
+    def flush(self):
+        """
+        Write every journalled timestamp with a single UPDATE. Returns the number of users
+        flushed. Entries stay in the journal when the write fails, for the next flush.
+
+        record() takes its sequence number before writing the entry, so a missing entry may
+        still be on its way: the flush stops short of it, and only skips it once it has been
+        missing for an interval (expired or evicted from the cache).
+        """
+        last = cache.get(PENDING_SEQ_KEY, 0)
+        done = cache.get(FLUSHED_KEY, 0)
+        if done > last:  # the counter was evicted and started over
+            done = 0
+        if last == done:
+            return 0
+        entries = cache.get_many([pending_cache_key(seq) for seq in range(done + 1, last + 1)])
+        now = timezone.now()
+        upto = last
+        for seq in range(done + 1, last + 1):
+            if pending_cache_key(seq) in entries:
+                continue
+            cache.add(gap_cache_key(seq), now, PENDING_TIMEOUT)
+            first_missing = cache.get(gap_cache_key(seq), now)
+            if (now - first_missing).total_seconds() < self.interval:
+                upto = seq - 1
+                break
+        keys = [pending_cache_key(seq) for seq in range(done + 1, upto + 1)]
+        pending = {}
+        for key in keys:
+            if key in entries:
+                uid, ts = entries[key]
+                if uid not in pending or pending[uid] < ts:
+                    pending[uid] = ts
+        if pending:
+            try:
+                write_last_activity(pending)
+            except Exception:
+                logger.exception("Could not flush last activity for %d users", len(pending))
+                return 0
+        if upto > done:
+            cache.set(FLUSHED_KEY, upto, None)
+            cache.delete_many(keys)
+        return len(pending)
+
+    def _ensure_flusher(self):
+        if self._flusher is not None or not getattr(settings, 'LAST_ACTIVITY_BACKGROUND_FLUSH', False):
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run, name='activity-flusher', daemon=True)
+                self._flusher.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            finally:
+                connection.close()
+
+
+def write_last_activity(timestamps):
+    """
+    Set Supplier.last_activity from `{user_id: timestamp}` in one statement, never moving a
+    value backwards.
+    """
+    if connection.vendor == 'postgresql':
+        values = ', '.join(['(%s, %s)'] * len(timestamps))
+        params = [value for item in timestamps.items() for value in item]
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {Supplier._meta.db_table} AS s
+                SET last_activity = v.seen
+                FROM (VALUES {values}) AS v(user_id, seen)
+                WHERE s.user_id = v.user_id::bigint
+                  AND (s.last_activity IS NULL OR s.last_activity < v.seen::timestamptz)
+                """,
+                params,
+            )
+        return
+    Supplier.objects.filter(user_id__in=timestamps).update(last_activity=Case(
+        *[When(user_id=uid, then=Value(ts)) for uid, ts in timestamps.items()],
+        output_field=DateTimeField(),
+    ))
+
+
+activity_tracker = ActivityTracker()
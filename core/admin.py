@@ -11,8 +11,10 @@ from .models import (
     UserProducts,
     Order,
     OrderItem,
-    SocialMediaPost
+    SocialMediaPost,
+    ImportJob,
+    ArchivedNotification
 )
 # Register your models here.
 
-admin.site.register([DosageForm,Supplier,Notification,ChatThread,Product,ChatMessage,Review,ReportAbuse,UserProducts,Order,OrderItem,SocialMediaPost])
\ No newline at end of file
+admin.site.register([DosageForm,Supplier,Notification,ChatThread,Product,ChatMessage,Review,ReportAbuse,UserProducts,Order,OrderItem,SocialMediaPost,ImportJob,ArchivedNotification])
\ No newline at end of file
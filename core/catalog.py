@@ -0,0 +1,210 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .models import Product, Supplier
+
+logger = logging.getLogger(__name__)
+
+CATALOG_MODIFIED_KEY = 'catalog:modified'
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+def version_cache():
+    """
+    The catalog timestamp and version live on the CATALOG_CACHE_ALIAS backend with the pages
+    they key, which must be shared by every web process (see settings.CACHES): a per-process
+    cache would let one process keep answering 304 for a catalog another has changed.
+    """
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def catalog_last_modified():
+    """When anything public in the catalog last changed; cached, so usually no query."""
+    cache = version_cache()
+    modified = cache.get(CATALOG_MODIFIED_KEY)
+    if modified is None:
+        stamps = [
+            Product.objects.aggregate(modified=Max('updated_at'))['modified'],
+            Supplier.objects.aggregate(modified=Max('updated_at'))['modified'],
+        ]
+        modified = max(filter(None, stamps), default=datetime(2000, 1, 1, tzinfo=dt_timezone.utc))
+        cache.set(CATALOG_MODIFIED_KEY, modified, None)
+    return modified
+
+
+def catalog_version():
+    """A counter bumped by every catalog write; never queries the database."""
+    cache = version_cache()
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # a counter cannot be recounted, so a lost one restarts from the clock (ms), which is
+        # past anything handed out before unless writes averaged more than one per ms
+        version = int(time.time() * 1000)
+        if not cache.add(CATALOG_VERSION_KEY, version, None):
+            version = cache.get(CATALOG_VERSION_KEY, version)
+    return version
+
+
+def touch_catalog(supplier_ids=()):
+    """
+    Record a catalog change: moves the given suppliers' updated_at to now, and the cached
+    catalog timestamp and version once the transaction commits.
+    """
+    now = timezone.now()
+    supplier_ids = {supplier_id for supplier_id in supplier_ids if supplier_id is not None}
+    if supplier_ids:
+        Supplier.objects.filter(pk__in=supplier_ids).update(updated_at=now)
+
+    def apply():
+        cache = version_cache()
+        cache.set(CATALOG_MODIFIED_KEY, now, None)
+        try:
+            cache.incr(CATALOG_VERSION_KEY)
+        except ValueError:
+            # not cached: the next read starts a new version
+            pass
+
+    transaction.on_commit(apply)
+
+
+class CatalogConditionalMixin:
+    """
+    For read-only catalog API views: tags GET responses with the catalog version (ETag) and
+    change time (Last-Modified), and answers a matching If-None-Match / If-Modified-Since
+    with a 304 before the view runs its queries or serializer.
+    """
+
+    def get(self, request, *args, **kwargs):
+        # read before the data, so a write landing meanwhile can only make the tag older
+        etag = f'W/"catalog-{catalog_version()}"'
+        last_modified = int(catalog_last_modified().timestamp())
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, no_cache=True)
+        return response
+
+
+class CatalogCache:
+    """
+    Read-through cache for catalog query results, on the CATALOG_CACHE_ALIAS backend.
+
+    Keys carry the catalog version, so every catalog write retires all cached pages at once
+    without deleting anything. On a miss only one caller computes the value (a short lock in
+    the cache); concurrent callers for the same key wait for it briefly instead of running
+    the same query, and fall back to computing it themselves if it does not arrive in time.
+    Hit/miss counts for this process are kept in `stats` and logged (core.catalog, INFO)
+    every `log_every` lookups.
+    """
+
+    def __init__(self, alias=None, timeout=None, lock_timeout=10, wait_interval=0.05, max_wait=2, sleep=time.sleep,
+                 log_every=1000):
+        self.alias = alias
+        self.timeout = timeout
+        self.lock_timeout = lock_timeout
+        self.wait_interval = wait_interval
+        self.max_wait = max_wait
+        self.sleep = sleep
+        self.log_every = log_every
+        self.stats = Counter()
+        self._stats_lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.alias or settings.CATALOG_CACHE_ALIAS]
+
+    def count(self, outcome):
+        with self._stats_lock:
+            self.stats[outcome] += 1
+            stats = dict(self.stats)
+        lookups = stats.get('hits', 0) + stats.get('misses', 0)
+        if outcome != 'waits' and self.log_every and lookups % self.log_every == 0:
+            logger.info(
+                "Catalog cache: %d lookups, %d hits (%.0f%%), %d misses, %d waited for a fill",
+                lookups, stats.get('hits', 0), 100 * stats.get('hits', 0) / lookups,
+                stats.get('misses', 0), stats.get('waits', 0),
+            )
+
+    def get_or_compute(self, key, compute):
+        """`(value, hit)` for `key`, calling `compute()` to fill it on a miss."""
+        value = self.cache.get(key)
+        if value is not None:
+            self.count('hits')
+            return value, True
+
+        lock_key = f'{key}:lock'
+        if not self.cache.add(lock_key, 1, self.lock_timeout):
+            waited = 0
+            while waited < self.max_wait:
+                self.sleep(self.wait_interval)
+                waited += self.wait_interval
+                value = self.cache.get(key)
+                if value is not None:
+                    self.count('hits')
+                    self.count('waits')
+                    return value, True
+            lock_key = None  # the holder is slow or gone; compute without it
+
+        try:
+            value = compute()
+            timeout = self.timeout if self.timeout is not None else settings.CATALOG_CACHE_TIMEOUT
+            self.cache.set(key, value, timeout)
+        finally:
+            if lock_key:
+                self.cache.delete(lock_key)
+        self.count('misses')
+        return value, False
+
+
+catalog_cache = CatalogCache()
+
+
+def _csv(value):
+    return ','.join(sorted({item.strip() for item in value.split(',') if item.strip()}))
+
+
+def catalog_query_key(view, request):
+    """
+    Cache key for a catalog list request: the catalog version plus the parameters that shape
+    the result, normalized so equivalent query strings share an entry. Anything else in the
+    query string is ignored.
+    """
+    params = request.query_params
+    ordering = params.get('ordering', '')
+    if ordering:
+        # invalid terms are dropped by OrderingFilter, but any ordering at all turns off search ranking
+        valid = [term for term in (term.strip() for term in ordering.split(',')) if term.lstrip('-') in view.ordering_fields]
+        ordering = ','.join(valid or view.ordering)
+    normalized = {
+        name: params.get(name, '').strip()
+        for name in view.filterset_class.base_filters
+    }
+    normalized.update({
+        'search': ' '.join(params.get('search', '').lower().split()),
+        'ordering': ordering,
+        'cursor': params.get('cursor', ''),
+        'page_size': view.paginator.get_page_size(request),
+        'fields': _csv(params.get('fields', '')),
+        'expand': _csv(params.get('expand', '')),
+    })
+    # page links are absolute, so the scheme and host are part of the result
+    query = urlencode(sorted((name, value) for name, value in normalized.items() if value))
+    digest = hashlib.sha1(f"{request.build_absolute_uri('/')}?{query}".encode()).hexdigest()
+    return f'catalog-query:{catalog_version()}:{digest}'
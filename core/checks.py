@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+def is_local_cache(alias):
+    return settings.CACHES.get(alias, {}).get('BACKEND', '').endswith('LocMemCache')
+
+
+@register(Tags.caches, deploy=True)
+def check_catalog_cache(app_configs, **kwargs):
+    """The catalog version must be shared by every web process, which a local-memory cache is not."""
+    if is_local_cache(settings.CATALOG_CACHE_ALIAS):
+        return [Warning(
+            "The catalog cache is local to each process, so processes disagree on the catalog version "
+            "and may answer 304 or serve cached pages for a catalog another process has changed.",
+            hint="Set CATALOG_CACHE_BACKEND (and CATALOG_CACHE_LOCATION) to a shared cache such as Redis.",
+            id='core.W001',
+        )]
+    return []
+
+
+@register(Tags.caches, deploy=True)
+def check_default_cache(app_configs, **kwargs):
+    """
+    The default cache holds state every process must agree on: the unread counters, the cached
+    supplier header that writes invalidate, and presence.
+    """
+    if is_local_cache('default'):
+        return [Warning(
+            "The default cache is local to each process, so unread counts, supplier headers and presence "
+            "updated by one process stay stale in the others.",
+            hint="Set DJANGO_CACHE_BACKEND (and DJANGO_CACHE_LOCATION) to a shared cache such as Redis.",
+            id='core.W003',
+        )]
+    return []
+
+
+@register(Tags.caches, deploy=True)
+def check_last_activity_flush(app_configs, **kwargs):
+    """The flush_last_activity beat task only sees the journal through a shared default cache."""
+    if is_local_cache('default') and not settings.LAST_ACTIVITY_BACKGROUND_FLUSH:
+        return [Warning(
+            "Last activity is journalled in a per-process cache that the flush_last_activity task "
+            "cannot read, and the in-process flusher is off, so Supplier.last_activity never updates.",
+            hint="Set DJANGO_CACHE_BACKEND to a shared cache such as Redis, or LAST_ACTIVITY_BACKGROUND_FLUSH=true.",
+            id='core.W002',
+        )]
+    return []
@@ -0,0 +1,36 @@
+# consumers.py
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .realtime import user_group
+
+# close code for a socket without a signed-in user; the page does not reconnect after it
+UNAUTHENTICATED_CLOSE_CODE = 4401
+
+
+class UserEventsConsumer(AsyncJsonWebsocketConsumer):
+    """
+    One socket per signed-in user: new chat messages, read receipts and notifications are
+    pushed here instead of the pages polling the thread and notification lists.
+    """
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            # accepted first, since a socket refused during the handshake only sees code 1006
+            await self.accept()
+            await self.close(code=UNAUTHENTICATED_CLOSE_CODE)
+            return
+        self.group_name = user_group(user.pk)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        # the socket is push-only; writes still go through the REST endpoints
+        pass
+
+    async def user_event(self, event):
+        await self.send_json({'type': event['event'], 'data': event['data']})
@@ -0,0 +1,42 @@
+from django.core.cache import cache
+
+from .models import Supplier
+
+SUPPLIER_CACHE_TIMEOUT = 60 * 60
+# the header only needs these; the Supplier signals drop the cached copy when they change
+SUPPLIER_CACHED_FIELDS = ('id', 'user_id', 'name', 'logo')
+
+
+def supplier_cache_key(user_id):
+    return f"supplier-profile:{user_id}"
+
+
+def get_current_supplier(request):
+    """
+    The logged-in user's Supplier (header fields only) or None. Memoized on the request and
+    cached across requests until the supplier is saved or deleted.
+    """
+    if hasattr(request, '_current_supplier'):
+        return request._current_supplier
+
+    supplier = None
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        key = supplier_cache_key(user.pk)
+        supplier = cache.get(key)
+        if supplier is None:
+            # False marks "no supplier profile" so it is cached too
+            supplier = Supplier.objects.filter(user=user).only(*SUPPLIER_CACHED_FIELDS).first() or False
+            cache.set(key, supplier, SUPPLIER_CACHE_TIMEOUT)
+        supplier = supplier or None
+
+    request._current_supplier = supplier
+    return supplier
+
+
+def supplier_profile(request):
+    supplier = get_current_supplier(request)
+    return {
+        'current_supplier': supplier,
+        'logo': supplier.logo if supplier and supplier.logo else None,
+    }
@@ -0,0 +1,105 @@
+import csv
+import tempfile
+import uuid
+from datetime import datetime
+
+import openpyxl
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from .models import OrderItem, Product
+
+CHUNK_SIZE = 2000
+
+# Headers are FIELD_ALIASES spellings, so a product export can be uploaded again as-is
+PRODUCT_COLUMNS = [
+    ("Name", "name"),
+    ("Strength", "strength"),
+    ("Dosage Form", "dosage_form__name"),
+    ("Expire Date", "expire_date"),
+    ("Price", "price"),
+    ("Stock Quantity", "stock_quantity"),
+]
+
+ORDER_COLUMNS = [
+    ("Order ID", "order_id"),
+    ("Order Date", "order__created_at"),
+    ("Status", "order__status"),
+    ("Customer", "order__customer_full_name"),
+    ("Pharmacy", "order__customer_pharmacy_name"),
+    ("Email", "order__customer_email_address"),
+    ("Phone", "order__customer_phone"),
+    ("Delivery Address", "order__customer_delivery_address"),
+    ("Product", "product__name"),
+    ("Strength", "product__strength"),
+    ("Quantity", "quantity"),
+    ("Unit Price", "price"),
+]
+
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+class Echo:
+    """File-like object that hands back what csv.writer writes, for streaming."""
+
+    def write(self, value):
+        return value
+
+
+def product_rows(supplier):
+    return Product.objects.filter(supplier=supplier).order_by("name", "id").values_list(
+        *[field for _, field in PRODUCT_COLUMNS]
+    ).iterator(chunk_size=CHUNK_SIZE)
+
+
+def order_rows(supplier):
+    return OrderItem.objects.filter(order__supplier=supplier).order_by("order__created_at", "id").values_list(
+        *[field for _, field in ORDER_COLUMNS]
+    ).iterator(chunk_size=CHUNK_SIZE)
+
+
+def _csv_response(headers, rows, filename):
+    writer = csv.writer(Echo())
+
+    def lines():
+        yield writer.writerow(headers)
+        for row in rows:
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(lines(), content_type=CONTENT_TYPES["csv"])
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _xlsx_cell(value):
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, datetime) and timezone.is_aware(value):
+        return timezone.make_naive(value)
+    return value
+
+
+def _xlsx_response(headers, rows, filename):
+    # An XLSX file is a zip archive that is only complete once saved, so unlike the CSV it
+    # cannot be sent while rows are still being read. Write-only mode keeps memory flat by
+    # flushing rows to a temporary file, which is then sent back in blocks.
+    wb = openpyxl.Workbook(write_only=True)
+    sheet = wb.create_sheet()
+    sheet.append(headers)
+    for row in rows:
+        sheet.append([_xlsx_cell(value) for value in row])
+    output = tempfile.TemporaryFile()
+    wb.save(output)
+    output.seek(0)
+    return FileResponse(output, as_attachment=True, filename=filename, content_type=CONTENT_TYPES["xlsx"])
+
+
+def export_response(columns, rows, basename, file_format):
+    headers = [header for header, _ in columns]
+    filename = f"{basename}-{timezone.now():%Y%m%d}.{file_format}"
+    if file_format == "xlsx":
+        return _xlsx_response(headers, rows, filename)
+    return _csv_response(headers, rows, filename)
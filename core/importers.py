@@ -0,0 +1,252 @@
+import logging
+import uuid
+from datetime import date, datetime, timedelta
+from itertools import islice
+
+import openpyxl
+from dateutil import parser
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .catalog import touch_catalog
+from .models import DosageForm, ImportJob, Product
+from .search import refresh_search_vectors
+
+logger = logging.getLogger(__name__)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class ProductImporter:
+    """
+    Set-based product import for one supplier. Rows are matched to existing products on
+    (name, strength, dosage form) with one query per batch and written with bulk_create /
+    bulk_update, so the query count depends on the number of batches, not rows.
+    """
+
+    FIELD_ALIASES = {
+        "name": ["name", "product name", "product_name"],
+        "strength": ["strength", "dose"],
+        "expire_date": ["expire_date", "expiry", "expire date", "expiry date", "expiration date"],
+        "price": ["price", "cost", "unit price"],
+        "stock_quantity": ["stock_quantity", "stock quantity", "quantity", "stock", "stock qty"],
+        "dosage_form_id": ["dosage_form_id", "dosage", "dosage form", "form"],
+    }
+    REQUIRED_FIELDS = ["name", "strength", "expire_date", "price", "stock_quantity", "dosage_form_id"]
+    UPDATE_FIELDS = ["stock_quantity", "price", "expire_date"]
+    batch_size = 500
+
+    def __init__(self, supplier):
+        self.supplier = supplier
+        self.dosage_forms = {name.lower(): pk for pk, name in DosageForm.objects.values_list('id', 'name')}
+        self.reset_counts()
+
+    def reset_counts(self):
+        self.created_count = 0
+        self.updated_count = 0
+        self.errors = []
+
+    @classmethod
+    def normalize_headers(cls, headers):
+        lookup = {alias.lower(): field for field, aliases in cls.FIELD_ALIASES.items() for alias in aliases}
+        normalized = {}
+        for h in headers:
+            if not h:
+                continue
+            field = lookup.get(str(h).strip().lower())
+            if field:
+                normalized[h] = field
+        return normalized
+
+    @staticmethod
+    def count_rows(file):
+        """Data rows announced by the sheet's dimension record, or None when it has none."""
+        wb = openpyxl.load_workbook(file, read_only=True)
+        try:
+            max_row = wb.active.max_row
+        finally:
+            wb.close()
+        file.seek(0)
+        return max(max_row - 1, 0) if max_row else None
+
+    @classmethod
+    def read_rows(cls, file, start_row=2):
+        """
+        Stream (row number, {field: value}) pairs from the active sheet in a single read-only pass.
+        """
+        wb = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            headers = next(rows, ())
+            header_map = cls.normalize_headers(headers)
+            for i, row in enumerate(rows, start=2):
+                if i < start_row:
+                    continue
+                yield i, {header_map[h]: v for h, v in zip(headers, row) if h in header_map}
+        finally:
+            wb.close()
+
+    def import_file(self, file):
+        for batch in batched(self.read_rows(file), self.batch_size):
+            self.import_batch(batch)
+        return self
+
+    def import_batch(self, rows):
+        cleaned = {}
+        for i, row_data in rows:
+            values = self.clean_row(i, row_data)
+            if values is not None:
+                key = (values["name"], values["strength"], values["dosage_form_id"])
+                if key in cleaned:
+                    # a repeated row updates what the earlier row wrote
+                    cleaned[key].update(values)
+                    self.updated_count += 1
+                else:
+                    cleaned[key] = values
+        if not cleaned:
+            return
+
+        existing = {
+            (p.name, p.strength, p.dosage_form_id): p
+            for p in Product.objects.filter(
+                supplier=self.supplier, name__in={key[0] for key in cleaned},
+            ).only("id", "name", "strength", "dosage_form_id", "last_posted_at", *self.UPDATE_FIELDS)
+        }
+
+        now = timezone.now()
+        to_create, to_update = [], []
+        for key, values in cleaned.items():
+            product = existing.get(key)
+            if product is None:
+                to_create.append(Product(product_id=str(uuid.uuid4()), supplier=self.supplier, updated_at=now, **values))
+            else:
+                if values["price"] != product.price or values["stock_quantity"] > product.stock_quantity:
+                    product.last_posted_at = None  # re-queue for posting, as the Product signal does
+                for field in self.UPDATE_FIELDS:
+                    setattr(product, field, values[field])
+                product.updated_at = now
+                to_update.append(product)
+
+        with transaction.atomic():
+            Product.objects.bulk_create(to_create, batch_size=self.batch_size)
+            Product.objects.bulk_update(
+                to_update, [*self.UPDATE_FIELDS, "last_posted_at", "updated_at"], batch_size=self.batch_size
+            )
+            if to_create:
+                refresh_search_vectors(Product.objects.filter(product_id__in=[p.product_id for p in to_create]))
+            touch_catalog([self.supplier.pk])
+        self.created_count += len(to_create)
+        self.updated_count += len(to_update)
+
+    def clean_row(self, i, row_data):
+        """
+        Validate one sheet row against the Product fields; records an error and returns None
+        when the row cannot be imported.
+        """
+        missing = [f for f in self.REQUIRED_FIELDS if row_data.get(f) in [None, ""]]
+        if missing:
+            self.errors.append(f"Row {i}: Missing required fields: {', '.join(missing)}")
+            return None
+
+        dosage_form_id = self.dosage_forms.get(str(row_data["dosage_form_id"]).strip().lower())
+        if not dosage_form_id:
+            self.errors.append(f"Row {i}: Invalid dosage form '{row_data['dosage_form_id']}'")
+            return None
+
+        expire_date = self.parse_date(row_data.get("expire_date"))
+        if expire_date is None:
+            self.errors.append(f"Row {i}: Invalid date format '{row_data.get('expire_date')}'")
+            return None
+
+        values = {"dosage_form_id": dosage_form_id, "expire_date": expire_date}
+        try:
+            for field in ("name", "strength", "price", "stock_quantity"):
+                value = row_data[field]
+                if isinstance(value, str) or field in ("name", "strength"):
+                    value = str(value).strip()
+                values[field] = Product._meta.get_field(field).clean(value, None)
+        except ValidationError as e:
+            self.errors.append(f"Row {i}: {field}: {' '.join(e.messages)}")
+            return None
+        return values
+
+    @staticmethod
+    def parse_date(value):
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, date):
+            return value
+        try:
+            return parser.parse(str(value)).date()
+        except (ValueError, OverflowError):
+            return None
+
+
+def claim_import_job(stale_after=timedelta(minutes=10)):
+    """
+    Lock and mark running the oldest pending job, or a running one whose worker stopped
+    committing batches. Safe to call from several workers at once. A stale job that has
+    already been claimed ImportJob.MAX_ATTEMPTS times is failed instead of retried, so a
+    file that kills its worker is not picked up forever.
+    """
+    stale = timezone.now() - stale_after
+    while True:
+        with transaction.atomic():
+            job = (
+                ImportJob.objects.select_for_update(skip_locked=True)
+                .filter(Q(status='pending') | Q(status='running', updated_at__lt=stale))
+                .order_by('created_at')
+                .first()
+            )
+            if job is None:
+                return None
+            if job.attempts < ImportJob.MAX_ATTEMPTS:
+                job.status = 'running'
+                job.attempts += 1
+                job.save(update_fields=['status', 'attempts', 'updated_at'])
+                return job
+            logger.error("Import job %s failed after %s attempts", job.pk, job.attempts)
+            job.status = 'failed'
+            job.errors.append(f"Import stopped after row {job.last_row}: the worker stopped {job.attempts} times")
+            job.finished_at = timezone.now()
+            job.save(update_fields=['status', 'errors', 'finished_at', 'updated_at'])
+
+
+def run_import_job(job):
+    """
+    Import the job's spreadsheet batch by batch, starting after the last committed row.
+    Each batch and the job's progress are committed together, so a crash loses at most one batch.
+    """
+    importer = ProductImporter(job.supplier)
+    try:
+        with job.file.open('rb') as file:
+            if job.total_rows is None:
+                job.total_rows = ProductImporter.count_rows(file)
+                job.save(update_fields=['total_rows', 'updated_at'])
+
+            for batch in batched(importer.read_rows(file, start_row=job.last_row + 1), importer.batch_size):
+                with transaction.atomic():
+                    importer.import_batch(batch)
+                    job.last_row = batch[-1][0]
+                    job.created_count += importer.created_count
+                    job.updated_count += importer.updated_count
+                    job.error_count += len(importer.errors)
+                    job.errors.extend(importer.errors[:ImportJob.MAX_STORED_ERRORS - len(job.errors)])
+                    job.save()
+                importer.reset_counts()
+    except Exception as e:
+        logger.exception("Import job %s failed", job.pk)
+        job.status = 'failed'
+        job.errors.append(f"Import stopped after row {job.last_row}: {e}")
+    else:
+        job.status = 'completed'
+        job.file.delete(save=False)
+    job.finished_at = timezone.now()
+    job.save()
+    return job
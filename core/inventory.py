@@ -0,0 +1,59 @@
+from django.db import transaction
+from django.db.models import F, Sum
+
+from .catalog import touch_catalog
+from .models import Product
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product, requested):
+        self.product = product
+        self.requested = requested
+        super().__init__(f"Only {product.stock_quantity} units of {product.name} are available.")
+
+
+def reserve_stock(quantities):
+    """
+    Deduct `{product_id: quantity}` from stock, all or nothing.
+
+    Rows are locked in primary-key order, so concurrent orders touching the same products
+    cannot deadlock, and each deduction is a conditional `stock_quantity >= n` UPDATE, so
+    stock never goes negative even where row locks are unavailable. Raises InsufficientStock
+    and rolls back the enclosing transaction when any product falls short. Stock is part of
+    the public catalog, so the suppliers' catalogs are touched.
+    """
+    with transaction.atomic():
+        locked = list(
+            Product.objects.select_for_update()
+            .filter(pk__in=quantities)
+            .order_by('pk')
+            .only('id', 'name', 'stock_quantity', 'supplier_id')
+        )
+        for product in locked:
+            quantity = quantities[product.pk]
+            reserved = Product.objects.filter(pk=product.pk, stock_quantity__gte=quantity).update(
+                stock_quantity=F('stock_quantity') - quantity
+            )
+            if not reserved:
+                raise InsufficientStock(product, quantity)
+        touch_catalog({product.supplier_id for product in locked})
+
+
+def release_stock(quantities):
+    """
+    Return `{product_id: quantity}` to stock with one UPDATE per product, in primary-key order,
+    and touch the suppliers' catalogs.
+    """
+    with transaction.atomic():
+        for product_id in sorted(quantities):
+            Product.objects.filter(pk=product_id).update(
+                stock_quantity=F('stock_quantity') + quantities[product_id]
+            )
+        touch_catalog(Product.objects.filter(pk__in=quantities).values_list('supplier_id', flat=True).distinct())
+
+
+def order_quantities(order):
+    """Quantity per product across an order's lines, aggregated in the database."""
+    return dict(
+        order.items.order_by().values('product_id').annotate(total=Sum('quantity')).values_list('product_id', 'total')
+    )
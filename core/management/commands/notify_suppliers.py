@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from core.models import Supplier
+from core.notifications import broadcast
+
+
+class Command(BaseCommand):
+    help = "Send the same notification to every supplier account with a single bulk insert."
+
+    def add_arguments(self, parser):
+        parser.add_argument('message')
+
+    def handle(self, *args, **options):
+        user_ids = Supplier.objects.filter(user__isnull=False).values_list('user_id', flat=True)
+        broadcast(user_ids, options['message'])
+        self.stdout.write(self.style.SUCCESS(f"Notified {len(user_ids)} suppliers"))
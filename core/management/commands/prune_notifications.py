@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.retention import RETENTION_BATCH_SIZE, prune_notifications
+
+
+class Command(BaseCommand):
+    help = "Remove read notifications older than the retention period, in small batches. Run it daily."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.NOTIFICATION_RETENTION_DAYS,
+            help="Keep read notifications newer than this many days.",
+        )
+        parser.add_argument('--batch-size', type=int, default=RETENTION_BATCH_SIZE)
+        parser.add_argument('--archive', action='store_true', help="Copy rows to the archive table before deleting.")
+        parser.add_argument('--pause', type=float, default=0, help="Seconds to sleep between batches.")
+
+    def handle(self, *args, **options):
+        summary = prune_notifications(
+            older_than=timezone.now() - timedelta(days=options['days']),
+            batch_size=options['batch_size'],
+            archive=options['archive'],
+            pause=options['pause'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Pruned {summary['deleted']} notifications ({summary['archived']} archived) "
+            f"in {summary['batches']} batches"
+        ))
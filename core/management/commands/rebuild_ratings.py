@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from core.ratings import rebuild_rating_aggregates
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored rating aggregates of all products and suppliers from their reviews."
+
+    def handle(self, *args, **options):
+        products, suppliers = rebuild_rating_aggregates()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt ratings for {products} products and {suppliers} suppliers"
+        ))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.importers import claim_import_job, run_import_job
+
+
+class Command(BaseCommand):
+    help = "Process queued product import jobs. Several workers may run side by side."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty.")
+        parser.add_argument('--sleep', type=float, default=2, help="Seconds to wait when the queue is empty.")
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_import_job()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
+                continue
+
+            job = run_import_job(job)
+            self.stdout.write(
+                f"Import {job.pk}: {job.status}, {job.created_count} created, "
+                f"{job.updated_count} updated, {job.error_count} errors"
+            )
@@ -1,20 +1,26 @@
 # middleware.py
-from django.utils import timezone
+from django.conf import settings
+
+from .activity import activity_tracker
+
 
 class UpdateLastActivityMiddleware:
+    """
+    Records the user's activity in the buffered tracker; Supplier.last_activity is written in
+    bulk by the tracker rather than once per request.
+    """
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.skip_prefixes = tuple(
+            '/' + url.lstrip('/') for url in (settings.STATIC_URL, settings.MEDIA_URL) if url
+        )
 
     def __call__(self, request):
         response = self.get_response(request)
 
-        if request.user.is_authenticated:
-            try:
-                profile = request.user.supplier_profile
-                profile.last_activity = timezone.now()
-                profile.save(update_fields=['last_activity'])
-            except Exception:
-                # In case the user has no supplier profile, just ignore
-                pass
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated and not request.path.startswith(self.skip_prefixes):
+            activity_tracker.record(user.pk)
 
         return response
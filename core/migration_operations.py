@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+class PostgresOnlyOperation:
+    """Runs the schema change on PostgreSQL only; other backends just record the state."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class AddPostgresIndex(PostgresOnlyOperation, migrations.AddIndex):
+    """An index only PostgreSQL can build (GIN, NULLS FIRST ordering)."""
+
+
+class AlterPostgresField(PostgresOnlyOperation, migrations.AlterField):
+    """
+    A column change on a table carrying PostgreSQL-only indexes. SQLite alters columns by
+    rebuilding the table, which would try to create those indexes, so there the column is
+    left as it was; the model's default still fills it on every write.
+    """
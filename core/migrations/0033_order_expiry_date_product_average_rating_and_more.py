@@ -0,0 +1,78 @@
+# Generated by Django 5.2.5 on 2026-10-18 13:47
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Product = apps.get_model('core', 'Product')
+    Supplier = apps.get_model('core', 'Supplier')
+
+    for model, review_path in ((Product, 'reviews'), (Supplier, 'products__reviews')):
+        rows = model.objects.annotate(
+            total=Sum(f'{review_path}__rating'),
+            n=Count(f'{review_path}__id'),
+        ).filter(n__gt=0).values_list('pk', 'total', 'n')
+        for pk, total, n in rows:
+            model.objects.filter(pk=pk).update(rating_sum=total, rating_count=n, average_rating=total / n)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0032_contactus'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='expiry_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='average_rating',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='supplier',
+            name='average_rating',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='supplier',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='supplier',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='contactus',
+            name='subject',
+            field=models.CharField(choices=[('wholesaler', 'wholesaler'), ('buyer', 'buyer'), ('partnership', 'partnership'), ('support', 'support'), ('other', 'other')], max_length=300),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='customer_delivery_address',
+            field=models.CharField(max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='customer_pharmacy_name',
+            field=models.CharField(max_length=200),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.5 on 2026-10-18 13:49
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+from core.migration_operations import AddPostgresIndex
+
+
+def backfill_search_vectors(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Product = apps.get_model('core', 'Product')
+    DosageForm = apps.get_model('core', 'DosageForm')
+    Supplier = apps.get_model('core', 'Supplier')
+    dosage_form = Subquery(DosageForm.objects.filter(pk=OuterRef('dosage_form_id')).values('name')[:1])
+    supplier = Subquery(Supplier.objects.filter(pk=OuterRef('supplier_id')).values('name')[:1])
+    Product.objects.update(search_vector=(
+        SearchVector('name', weight='A', config='simple')
+        + SearchVector('strength', dosage_form, weight='B', config='simple')
+        + SearchVector(supplier, weight='C', config='simple')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0033_order_expiry_date_product_average_rating_and_more'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        AddPostgresIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
+        ),
+        AddPostgresIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='product_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.RunPython(backfill_search_vectors, migrations.RunPython.noop),
+    ]
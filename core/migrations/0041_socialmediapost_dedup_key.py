@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0040_archivednotification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='socialmediapost',
+            name='dedup_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:15
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0041_socialmediapost_dedup_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='supplier',
+            name='custom_time',
+            field=models.TimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='supplier',
+            name='next_post_at',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now, null=True),
+        ),
+        migrations.AddField(
+            model_name='supplier',
+            name='post_frequency',
+            field=models.CharField(choices=[('daily', 'Daily'), ('weekly', 'Weekly'), ('custom', 'Custom')], default='daily', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='supplier',
+            name='telegram_chat_id',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='supplier',
+            index=models.Index(condition=models.Q(('next_post_at__isnull', False)), fields=['next_post_at'], name='supplier_next_post_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:16
+
+from django.db import migrations, models
+
+from core.migration_operations import AddPostgresIndex
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0042_supplier_custom_time_supplier_next_post_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='last_posted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        AddPostgresIndex(
+            model_name='product',
+            index=models.Index(models.F('supplier'), models.OrderBy(models.F('last_posted_at'), nulls_first=True), models.F('id'), name='product_post_queue_idx'),
+        ),
+    ]
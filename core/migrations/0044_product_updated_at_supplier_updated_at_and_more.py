@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:20
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models.functions import Now
+
+
+def backfill_product_updated_at(apps, schema_editor):
+    Product = apps.get_model('core', 'Product')
+    Product.objects.filter(updated_at__isnull=True).update(updated_at=Now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0043_product_last_posted_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='updated_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='supplier',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['updated_at'], name='product_updated_idx'),
+        ),
+        migrations.RunPython(backfill_product_updated_at, migrations.RunPython.noop),
+    ]
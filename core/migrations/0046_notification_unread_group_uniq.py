@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:39
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+
+
+def merge_duplicate_unread_groups(apps, schema_editor):
+    # rows written concurrently before the constraint existed: keep the newest, summing counts
+    Notification = apps.get_model('core', 'Notification')
+    unread = Notification.objects.filter(is_read=False).exclude(group_key='')
+    duplicates = (
+        unread.values('recipient_id', 'group_key')
+        .annotate(rows=Count('id'), total=Sum('count'), newest=Max('id'))
+        .filter(rows__gt=1)
+    )
+    for group in duplicates:
+        same = unread.filter(recipient_id=group['recipient_id'], group_key=group['group_key'])
+        same.exclude(pk=group['newest']).delete()
+        same.filter(pk=group['newest']).update(count=group['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0045_importjob_attempts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='notification',
+            name='notification_unread_group_idx',
+        ),
+        migrations.RunPython(merge_duplicate_unread_groups, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_read', False), models.Q(('group_key', ''), _negated=True)), fields=('recipient', 'group_key'), name='notification_unread_group_uniq'),
+        ),
+    ]
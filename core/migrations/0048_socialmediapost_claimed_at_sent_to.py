@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0047_notification_list_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='socialmediapost',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='socialmediapost',
+            name='sent_to',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0048_socialmediapost_claimed_at_sent_to'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='supplier',
+            name='claimed_until',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:13
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models.functions import Now
+
+from core.migration_operations import AlterPostgresField
+
+
+def backfill_product_updated_at(apps, schema_editor):
+    Product = apps.get_model('core', 'Product')
+    Product.objects.filter(updated_at__isnull=True).update(updated_at=Now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0049_supplier_claimed_until'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_product_updated_at, migrations.RunPython.noop),
+        AlterPostgresField(
+            model_name='product',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -1,7 +1,9 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import F
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import User
-from django.db.models import Avg
 import uuid
 from django.utils import timezone
 from datetime import timedelta
@@ -20,7 +22,11 @@ class Supplier(models.Model):
         ('3-5', 'Within 3 to 5 Minutes'),
         ('longer', 'A little longer'),
     ]
-
+    POST_FREQUENCY_CHOICES = [
+        ('daily', 'Daily'),
+        ('weekly', 'Weekly'),
+        ('custom', 'Custom'),
+    ]
 
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='supplier_profile', null=True, blank=True)
     name = models.CharField(max_length=100)
@@ -31,17 +37,33 @@ class Supplier(models.Model):
     address = models.TextField(blank=True, null=True)
     response_time = models.CharField(max_length=10, choices=RESPONSE_TIME_CHOICES, default='instantly')
     created_at = models.DateTimeField(auto_now=True)
+    # last change to the supplier's public page or catalog (see core.catalog), unlike created_at
+    # which moves on every save
+    updated_at = models.DateTimeField(default=timezone.now, editable=False)
     last_activity = models.DateTimeField(null=True, blank=True)
 
+    # Rating aggregates over all reviews of this supplier's products, kept current by the Review signals
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    average_rating = models.FloatField(default=0)
+
+    # Telegram posting schedule (core.tasks): the supplier is due once next_post_at has passed;
+    # custom_time pins the time of day, an empty next_post_at pauses posting
+    post_frequency = models.CharField(max_length=20, choices=POST_FREQUENCY_CHOICES, default='daily')
+    custom_time = models.TimeField(blank=True, null=True)
+    telegram_chat_id = models.CharField(max_length=100, blank=True, null=True)  # extra group/channel for its posts
+    next_post_at = models.DateTimeField(default=timezone.now, null=True, blank=True)
+    # lease held by the run posting the supplier; next_post_at only moves once the post is recorded
+    claimed_until = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_post_at'], condition=models.Q(next_post_at__isnull=False), name='supplier_next_post_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
-    @property
-    def average_rating(self):
-        from .models import Review  # avoid circular import
-        avg = Review.objects.filter(product__supplier=self).aggregate(avg=Avg('rating'))['avg']
-        return round(avg, 2) if avg else 0
-
 
 class Product(models.Model):
     product_id = models.CharField(max_length=50, unique=True)
@@ -54,6 +76,37 @@ class Product(models.Model):
     dosage_form = models.ForeignKey(DosageForm, on_delete=models.CASCADE, related_name='dosage')
     supplier = models.ForeignKey(Supplier, on_delete=models.CASCADE, related_name='products')
 
+    # Rating aggregates over this product's reviews, kept current by the Review signals
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    average_rating = models.FloatField(default=0)
+
+    # name, strength, dosage form and supplier name; refreshed by signals (PostgreSQL only)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # stamped on every save and review change (see core.catalog)
+    updated_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    # when the product was last in a Telegram post; cleared (re-queued) by a price change or restock
+    last_posted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='product_name_trgm_idx'),
+            # keyset pagination of the public catalog: (ordering field, id)
+            models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+            models.Index(fields=['stock_quantity', 'id'], name='product_stock_id_idx'),
+            models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+            # catalog last-modified (sitemaps, conditional responses)
+            models.Index(fields=['updated_at'], name='product_updated_idx'),
+            # the Telegram posting queue: never posted first, then least recently posted
+            models.Index(
+                F('supplier'), F('last_posted_at').asc(nulls_first=True), F('id'),
+                name='product_post_queue_idx',
+            ),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.strength})"
 
@@ -64,11 +117,42 @@ class Notification(models.Model):
     message = models.TextField()
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # unread notifications sharing a group key are collapsed into one row (see core.notifications)
+    group_key = models.CharField(max_length=100, blank=True, default='')
+    count = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            # the paginated list, newest first with the pk tie-break (NotificationPagination)
+            models.Index(fields=['recipient', '-created_at', '-id'], name='notification_list_idx'),
+            # the unread count and mark-all-read
+            models.Index(fields=['recipient'], condition=models.Q(is_read=False), name='notification_unread_idx'),
+        ]
+        constraints = [
+            # at most one unread row per group, which concurrent notify() calls fold into
+            models.UniqueConstraint(
+                fields=['recipient', 'group_key'],
+                condition=models.Q(is_read=False) & ~models.Q(group_key=''),
+                name='notification_unread_group_uniq',
+            ),
+        ]
 
     def __str__(self):
         return f"Notification to {self.recipient.username}:"
 
 
+class ArchivedNotification(models.Model):
+    """Read notifications moved out of the hot table by the retention job (prune_notifications)."""
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_notifications')
+    message = models.TextField()
+    count = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived notification to {self.recipient.username}:"
+
+
 class ChatThread(models.Model):
     user_1 = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_threads_started')
     user_2 = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_threads_received')
@@ -87,6 +171,12 @@ class ChatMessage(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # thread history pages and each thread's latest message
+            models.Index(fields=['thread', 'timestamp'], name='chatmessage_thread_time_idx'),
+        ]
+
     def __str__(self):
         return f"Message from {self.sender.username} at {self.timestamp}"
 
@@ -184,33 +274,75 @@ class OrderItem(models.Model):
         return f"{self.quantity} x {self.product.name}"
 
 
+def import_upload_path(instance, filename):
+    # one file per job, so concurrent uploads never overwrite each other
+    return f"imports/{instance.id}.xlsx"
+
+
+class ImportJob(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    MAX_STORED_ERRORS = 1000
+    # a job whose worker died this many times is taken to be the cause and failed
+    MAX_ATTEMPTS = 3
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    supplier = models.ForeignKey(Supplier, on_delete=models.CASCADE, related_name='import_jobs')
+    file = models.FileField(upload_to=import_upload_path)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    total_rows = models.PositiveIntegerField(null=True, blank=True)
+    # last sheet row whose batch has been committed; a restarted worker resumes after it
+    last_row = models.PositiveIntegerField(default=1)
+    attempts = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    updated_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'updated_at'])]
+
+    def __str__(self):
+        return f"Import {self.id} for {self.supplier.name} ({self.status})"
+
+    @property
+    def processed_rows(self):
+        return self.last_row - 1
+
+    @property
+    def progress(self):
+        if self.status == 'completed':
+            return 100
+        if not self.total_rows:
+            return 0
+        return min(99, int(self.processed_rows * 100 / self.total_rows))
+
+
 class SocialMediaPost(models.Model):
     supplier = models.ForeignKey(Supplier, on_delete=models.CASCADE, related_name='telegram_posts')
     products = models.ManyToManyField(Product)
     template_used = models.IntegerField(default=1)
     post_date = models.DateField(auto_now_add=True)
     posted = models.BooleanField(default=False)
+    # "<supplier id>:<date>", claimed before sending so a supplier is posted at most once a day
+    # however many times the task runs
+    dedup_key = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
+    # set while a run is sending the post; a failed send clears it so the next run resumes it
+    claimed_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # chats the post has already reached, which a resumed send skips
+    sent_to = models.JSONField(default=list, blank=True, editable=False)
 
     def __str__(self):
         return f"{self.supplier.name} - {self.post_date}"
 
 
-# class SupplierProfile(models.Model):
-#     user = models.OneToOneField(User, on_delete=models.CASCADE)
-#     telegram_chat_id = models.CharField(max_length=100, blank=True, null=True)  # group/channel chat_id
-#     post_frequency = models.CharField(
-#         max_length=20,
-#         choices=[
-#             ("daily", "Daily"),
-#             ("weekly", "Weekly"),
-#             ("custom", "Custom"),
-#         ],
-#         default="daily"
-#     )
-#     custom_time = models.TimeField(blank=True, null=True)  # if they want exact time posting
-
-
-
 class ContactUs(models.Model):
     SUBJECT_CHOICES = [
         ('wholesaler', 'wholesaler'),
@@ -0,0 +1,132 @@
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Notification
+from .realtime import push_to_user
+from .serializers import NotificationSerializer
+from .unread import adjust_unread
+
+
+class NotificationBatch:
+    """
+    Queued notifications written together: new rows with one bulk_create, and notifications
+    with a group key folded into the recipient's unread row for that key (one locked SELECT
+    plus one bulk_update) instead of piling up one row per event.
+    """
+
+    def __init__(self):
+        self.pending = {}
+
+    def add(self, recipient_id, message, group_key='', group_message=None):
+        """
+        `group_message` is used once a group holds more than one event and may reference
+        `{count}`, e.g. "You have {count} new Messages".
+        """
+        if not group_key:
+            self.pending[(recipient_id, None, len(self.pending))] = [message, message, 1]
+            return
+        key = (recipient_id, group_key)
+        if key in self.pending:
+            self.pending[key][2] += 1
+        else:
+            self.pending[key] = [message, group_message or message, 1]
+
+    def flush(self):
+        """Write everything queued so far and return the created or updated notifications."""
+        pending, self.pending = self.pending, {}
+        if not pending:
+            return []
+
+        try:
+            created, updated = self._write(pending)
+        except IntegrityError:
+            # another request inserted the unread row for one of our groups between our SELECT
+            # and INSERT (notification_unread_group_uniq); it is visible now, so fold into it
+            created, updated = self._write(pending)
+
+        notifications = created + updated
+        for notification in notifications:
+            push_notification(notification)
+        return notifications
+
+    def _write(self, pending):
+        now = timezone.now()
+        grouped = {key: value for key, value in pending.items() if key[1] is not None}
+        with transaction.atomic():
+            existing = self._unread_groups(grouped) if grouped else {}
+
+            created, updated = [], []
+            for key, (message, group_message, count) in pending.items():
+                row = existing.get(key)
+                if row is not None:
+                    row.count += count
+                    row.message = group_message.format(count=row.count)
+                    row.created_at = now
+                    updated.append(row)
+                    continue
+                recipient_id, group_key = key[0], key[1] or ''
+                created.append(Notification(
+                    recipient_id=recipient_id,
+                    group_key=group_key,
+                    count=count,
+                    message=message if count == 1 else group_message.format(count=count),
+                ))
+            if created:
+                Notification.objects.bulk_create(created)
+                # collapsed rows were already unread, so only new rows move the badge
+                adjust_unread('notifications', Counter(n.recipient_id for n in created))
+            if updated:
+                Notification.objects.bulk_update(updated, ['count', 'message', 'created_at'])
+        return created, updated
+
+    @staticmethod
+    def _unread_groups(grouped):
+        rows = Notification.objects.select_for_update().filter(
+            recipient_id__in={recipient_id for recipient_id, _ in grouped},
+            group_key__in={group_key for _, group_key in grouped},
+            is_read=False,
+        )
+        return {(row.recipient_id, row.group_key): row for row in rows}
+
+
+def push_notification(notification):
+    push_to_user(notification.recipient_id, 'notification', NotificationSerializer(notification).data)
+
+
+_local = threading.local()
+
+
+@contextmanager
+def batch():
+    """Queue every notify()/broadcast() made inside the block and write them once on exit."""
+    outer = getattr(_local, 'batch', None)
+    if outer is not None:
+        yield outer
+        return
+    _local.batch = current = NotificationBatch()
+    try:
+        yield current
+    finally:
+        _local.batch = None
+    current.flush()
+
+
+def notify(recipient, message, group_key='', group_message=None):
+    """
+    Notify one user. Inside batch() this is queued; otherwise it is written straight away.
+    `recipient` is a User or a user id.
+    """
+    recipient_id = getattr(recipient, 'pk', recipient)
+    with batch() as current:
+        current.add(recipient_id, message, group_key, group_message)
+
+
+def broadcast(recipients, message):
+    """Send the same notification to many users (Users, ids or a queryset) with one insert."""
+    with batch() as current:
+        for recipient in recipients:
+            current.add(getattr(recipient, 'pk', recipient), message)
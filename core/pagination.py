@@ -0,0 +1,120 @@
+import binascii
+import json
+from base64 import b64decode, b64encode
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class ProductProviderPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Forward-only keyset pagination. Pages are ordered by the queryset's first ordering term
+    (as set by OrderingFilter, or an annotation such as the search rank) with the primary key
+    as tie-breaker, and the cursor carries the last row's (value, pk) so each page is a single
+    indexed range scan whatever its depth.
+    """
+    page_size = 24
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+
+        ordering = next(iter(queryset.query.order_by), 'pk')
+        if not isinstance(ordering, str):
+            ordering = 'pk'
+        field = ordering.lstrip('-')
+        descending = ordering.startswith('-')
+        lookup = 'lt' if descending else 'gt'
+        queryset = queryset.order_by(ordering, '-pk' if descending else 'pk')
+
+        position = self.decode_cursor(request, ordering, queryset)
+        if position is not None:
+            value, pk = position
+            queryset = queryset.filter(
+                Q(**{f'{field}__{lookup}': value}) | Q(**{field: value, f'pk__{lookup}': pk})
+            )
+
+        rows = list(queryset[:self.page_size + 1])
+        self.page = rows[:self.page_size]
+        self.next_position = None
+        if len(rows) > self.page_size:
+            last = self.page[-1]
+            self.next_position = (ordering, getattr(last, field), last.pk)
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def decode_cursor(self, request, ordering, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor_ordering, value, pk = json.loads(b64decode(encoded.encode('ascii')))
+        except (TypeError, ValueError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if cursor_ordering != ordering:
+            raise NotFound(self.invalid_cursor_message)
+        # coerce the position to the ordering field's type here, so a tampered cursor is a 404
+        # rather than a database error
+        name, opts = ordering.lstrip('-'), queryset.model._meta
+        try:
+            if name in queryset.query.annotations:
+                # e.g. the search rank ProductSearchFilter orders by
+                field = queryset.query.annotations[name].output_field
+            else:
+                field = opts.pk if name == 'pk' else opts.get_field(name)
+            value, pk = field.to_python(value), opts.pk.to_python(pk)
+        except (FieldDoesNotExist, ValidationError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        if value is None or pk is None:
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk
+
+    def encode_cursor(self, position):
+        encoded = b64encode(json.dumps(position, default=str).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class ChatMessagePagination(KeysetCursorPagination):
+    page_size = 50
+
+
+class NotificationPagination(KeysetCursorPagination):
+    page_size = 20
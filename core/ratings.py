@@ -0,0 +1,88 @@
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+
+from django.utils import timezone
+
+from .catalog import touch_catalog
+from .models import Product, Review, Supplier
+
+
+def _rating_delta(delta_sum, delta_count):
+    """
+    Build the UPDATE kwargs that shift the stored rating aggregates by the given deltas.
+    All right-hand sides read the pre-update row, so the average is derived from the new
+    sum/count inside the same statement.
+    """
+    new_sum = F('rating_sum') + delta_sum
+    new_count = F('rating_count') + delta_count
+    return {
+        'rating_sum': new_sum,
+        'rating_count': new_count,
+        'average_rating': Case(
+            When(rating_count__gt=-delta_count, then=Cast(new_sum, FloatField()) / new_count),
+            default=Value(0.0),
+            output_field=FloatField(),
+        ),
+    }
+
+
+def apply_rating_change(product_id, delta_sum, delta_count):
+    """
+    Apply a review rating change to a product and its supplier in one transaction.
+    """
+    if not delta_sum and not delta_count:
+        return
+    with transaction.atomic():
+        supplier_id = Product.objects.filter(pk=product_id).values_list('supplier_id', flat=True).first()
+        Product.objects.filter(pk=product_id).update(updated_at=timezone.now(), **_rating_delta(delta_sum, delta_count))
+        if supplier_id:
+            Supplier.objects.filter(pk=supplier_id).update(**_rating_delta(delta_sum, delta_count))
+        touch_catalog([supplier_id])
+
+
+def move_product_ratings(rating_sum, rating_count, from_supplier_id, to_supplier_id):
+    """
+    Shift a product's rating totals from one supplier's aggregates to another's, for a product
+    that changed supplier.
+    """
+    if not rating_count:
+        return
+    with transaction.atomic():
+        if from_supplier_id:
+            Supplier.objects.filter(pk=from_supplier_id).update(**_rating_delta(-rating_sum, -rating_count))
+        if to_supplier_id:
+            Supplier.objects.filter(pk=to_supplier_id).update(**_rating_delta(rating_sum, rating_count))
+        touch_catalog([from_supplier_id, to_supplier_id])
+
+
+def _average_from_totals():
+    return Case(
+        When(rating_count__gt=0, then=Cast('rating_sum', FloatField()) / F('rating_count')),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+def rebuild_rating_aggregates():
+    """
+    Recompute the stored rating aggregates of every product and supplier from the reviews table.
+    Runs a fixed number of set-based UPDATEs regardless of catalog size.
+    """
+    product_reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    supplier_products = Product.objects.filter(supplier=OuterRef('pk')).order_by().values('supplier')
+
+    with transaction.atomic():
+        products = Product.objects.update(
+            rating_sum=Coalesce(Subquery(product_reviews.annotate(total=Sum('rating')).values('total')), 0),
+            rating_count=Coalesce(Subquery(product_reviews.annotate(total=Count('id')).values('total')), 0),
+        )
+        Product.objects.update(average_rating=_average_from_totals())
+
+        suppliers = Supplier.objects.update(
+            rating_sum=Coalesce(Subquery(supplier_products.annotate(total=Sum('rating_sum')).values('total')), 0),
+            rating_count=Coalesce(Subquery(supplier_products.annotate(total=Sum('rating_count')).values('total')), 0),
+        )
+        Supplier.objects.update(average_rating=_average_from_totals())
+
+    return products, suppliers
@@ -0,0 +1,30 @@
+# realtime.py
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+
+def user_group(user_id):
+    return f"user-{user_id}"
+
+
+def push_to_user(user_ids, event_type, payload):
+    """
+    Sends an event to the WebSocket group of each user once the surrounding transaction
+    commits, so clients never see rows that are rolled back.
+    """
+    if isinstance(user_ids, int):
+        user_ids = [user_ids]
+    user_ids = [user_id for user_id in dict.fromkeys(user_ids) if user_id is not None]
+    if not user_ids:
+        return
+
+    def send():
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+        group_send = async_to_sync(channel_layer.group_send)
+        for user_id in user_ids:
+            group_send(user_group(user_id), {'type': 'user.event', 'event': event_type, 'data': payload})
+
+    transaction.on_commit(send)
@@ -0,0 +1,53 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedNotification, Notification
+
+RETENTION_BATCH_SIZE = 1000
+
+
+def prune_notifications(older_than=None, batch_size=RETENTION_BATCH_SIZE, archive=False, pause=0):
+    """
+    Delete (or archive, then delete) read notifications created before `older_than`, which
+    defaults to NOTIFICATION_RETENTION_DAYS ago.
+
+    Rows are walked by primary key in batches of `batch_size`: each batch is one short
+    transaction over an indexed pk range, so no lock is held for longer than a batch and a
+    run can be stopped and restarted at any point. Returns a summary dict.
+    """
+    if older_than is None:
+        older_than = timezone.now() - timedelta(days=settings.NOTIFICATION_RETENTION_DAYS)
+    expired = Notification.objects.filter(is_read=True, created_at__lt=older_than).order_by('pk')
+
+    summary = {'deleted': 0, 'archived': 0, 'batches': 0}
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                expired.select_for_update().filter(pk__gt=last_pk)
+                .values('pk', 'recipient_id', 'message', 'count', 'created_at')[:batch_size]
+            )
+            if not rows:
+                break
+            last_pk = rows[-1]['pk']
+            if archive:
+                ArchivedNotification.objects.bulk_create([
+                    ArchivedNotification(
+                        recipient_id=row['recipient_id'],
+                        message=row['message'],
+                        count=row['count'],
+                        created_at=row['created_at'],
+                    )
+                    for row in rows
+                ])
+                summary['archived'] += len(rows)
+            deleted, _ = Notification.objects.filter(pk__in=[row['pk'] for row in rows]).delete()
+        summary['deleted'] += deleted
+        summary['batches'] += 1
+        if pause:
+            time.sleep(pause)
+    return summary
@@ -0,0 +1,78 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db import connection
+from django.db.models import F, FloatField, OuterRef, Q, Subquery
+from django.db.models.functions import Cast
+from rest_framework.filters import SearchFilter
+
+from .models import DosageForm, Supplier
+
+SEARCH_CONFIG = 'simple'  # drug names should not be stemmed
+
+
+def search_enabled():
+    return connection.vendor == 'postgresql'
+
+
+def split_search_terms(terms):
+    """
+    Break search terms into the word tokens the search vector holds, so "co-amoxiclav" matches
+    as "co" & "amoxiclav" instead of an unknown "coamoxiclav".
+    """
+    return [word for term in terms for word in re.split(r'\W+', term) if word]
+
+
+def product_search_vector():
+    """
+    Expression rebuilding Product.search_vector inside an UPDATE. Related names are read through
+    subqueries because UPDATE cannot join.
+    """
+    dosage_form = Subquery(DosageForm.objects.filter(pk=OuterRef('dosage_form_id')).values('name')[:1])
+    supplier = Subquery(Supplier.objects.filter(pk=OuterRef('supplier_id')).values('name')[:1])
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('strength', dosage_form, weight='B', config=SEARCH_CONFIG)
+        + SearchVector(supplier, weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def refresh_search_vectors(queryset):
+    """
+    Recompute the stored search vector for every product in `queryset` with a single UPDATE.
+    """
+    if not search_enabled():
+        return 0
+    return queryset.update(search_vector=product_search_vector())
+
+
+class ProductSearchFilter(SearchFilter):
+    """
+    Ranked full-text search over Product.search_vector, OR-ed with trigram similarity on the
+    name so misspelled drug names still match. Place it after OrderingFilter: results are ranked
+    unless the client asked for an explicit ordering, and ranked pages follow each other on a
+    (search_rank, pk) cursor.
+
+    Falls back to the plain `search_fields` icontains search on databases other than PostgreSQL.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        if not search_enabled():
+            return super().filter_queryset(request, queryset, view)
+
+        terms = split_search_terms(self.get_search_terms(request))
+        if not terms:
+            return queryset
+        text = ' '.join(terms)
+
+        # prefix match every term, so results show up while the user is still typing
+        query = SearchQuery(' & '.join(f'{term}:*' for term in terms), search_type='raw', config=SEARCH_CONFIG)
+        # ts_rank and similarity are float4; as double precision the rank survives the keyset
+        # cursor's JSON round trip exactly, so the next page starts right after this one
+        queryset = queryset.annotate(
+            search_rank=Cast(SearchRank(F('search_vector'), query) + TrigramSimilarity('name', text), FloatField()),
+        ).filter(Q(search_vector=query) | Q(name__trigram_similar=text))
+
+        if request.query_params.get('ordering'):
+            return queryset
+        return queryset.order_by('-search_rank', *queryset.query.order_by)
@@ -1,9 +1,11 @@
 from rest_framework import serializers
-from .models import ChatMessage, ChatThread, ContactUs, DosageForm, Notification, Order, OrderItem, Product, ReportAbuse, Review, UserProducts
+from .models import ChatMessage, ChatThread, ContactUs, DosageForm, ImportJob, Notification, Order, OrderItem, Product, ReportAbuse, Review, UserProducts
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 from django.db.models import Q
-from django.db import transaction
+from django.db import models, transaction
+from .activity import activity_tracker
+from .inventory import InsufficientStock, order_quantities, release_stock, reserve_stock
 
 class DosageFormSerializer(serializers.ModelSerializer):
     class Meta:
@@ -93,10 +95,7 @@ class ProductDetailSerializer(serializers.ModelSerializer):
 
 
     def get_average_rating(self, obj):
-        reviews = obj.reviews.all()
-        if reviews.exists():
-            return round(sum(r.rating for r in reviews) / reviews.count(), 1)
-        return None
+        return round(obj.average_rating, 1) if obj.rating_count else None
 
 class ReportAbuseSerializer(serializers.ModelSerializer):
     product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all())
@@ -123,44 +122,75 @@ from django.utils import timezone
 
 
 
+class ChatThreadListSerializer(serializers.ListSerializer):
+    """Resolves the other party of every thread on the page and their presence in one pass."""
+
+    def to_representation(self, data):
+        threads = list(data.all() if isinstance(data, models.Manager) else data)
+        current_user = self.context['request'].user
+        for thread in threads:
+            thread.other_user = thread.user_2 if thread.user_1_id == current_user.pk else thread.user_1
+        self.child.context['last_seen'] = activity_tracker.last_seen_many(
+            thread.other_user.pk for thread in threads
+        )
+        return super().to_representation(threads)
+
+
 class ChatThreadSerializer(serializers.ModelSerializer):
     user_1 = serializers.StringRelatedField(read_only=True)
     user_2 = serializers.StringRelatedField(read_only=True)
-    messages = ChatMessageSerializer(many=True, read_only=True)
+    # summary only: the full history is paged by ChatMessageListAPIView
+    last_message = serializers.SerializerMethodField()
+    unread_count = serializers.IntegerField(read_only=True)
+    other_party = serializers.SerializerMethodField()
     supplier_logo = serializers.SerializerMethodField()
 
     seller_last_seen = serializers.SerializerMethodField()
 
     class Meta:
         model = ChatThread
-        fields = ['id', 'user_1', 'user_2', 'created_at', 'messages', 'supplier_logo','seller_last_seen',]
+        fields = ['id', 'user_1', 'user_2', 'created_at', 'last_message', 'unread_count', 'other_party', 'supplier_logo','seller_last_seen',]
+        list_serializer_class = ChatThreadListSerializer
+
+    def get_other_user(self, obj):
+        # set for the whole page by ChatThreadListSerializer; users and supplier profiles are
+        # select_related by ChatThreadListAPIView, so none of this touches the database
+        if not hasattr(obj, 'other_user'):
+            current_user = self.context['request'].user
+            obj.other_user = obj.user_2 if obj.user_1_id == current_user.pk else obj.user_1
+        return obj.other_user
+
+    def get_last_message(self, obj):
+        # filled by the view's sliced Prefetch (to_attr='latest_messages')
+        latest = getattr(obj, 'latest_messages', None)
+        return ChatMessageSerializer(latest[0]).data if latest else None
+
+    def get_other_party(self, obj):
+        other_user = self.get_other_user(obj)
+        supplier = getattr(other_user, 'supplier_profile', None)
+        return supplier.name if supplier else other_user.username
 
     def get_supplier_logo(self, obj):
-        request = self.context.get('request')
-        current_user = request.user
-
-        # Identify the "other" user in the thread
-        other_user = obj.user_2 if obj.user_1 == current_user else obj.user_1
-
-        # Assuming Supplier model has a OneToOneField to User and a `logo` ImageField
-        supplier = getattr(other_user, 'supplier_profile', None)
+        supplier = getattr(self.get_other_user(obj), 'supplier_profile', None)
         if supplier and supplier.logo:
-            return request.build_absolute_uri(supplier.logo.url)
+            return self.context['request'].build_absolute_uri(supplier.logo.url)
         return None
 
     def get_seller_last_seen(self, obj):
-        request_user = self.context['request'].user
+        other_user = self.get_other_user(obj)
 
-        if obj.user_1 == request_user:
-            seller_user = obj.user_2
+        # the activity buffer is fresher than the periodically flushed column
+        if 'last_seen' in self.context:
+            last_seen = self.context['last_seen'].get(other_user.pk)
         else:
-            seller_user = obj.user_1
-
-        seller_profile = getattr(seller_user, 'seller_profile', None)
-        if not seller_profile or not seller_profile.last_activity:
+            last_seen = activity_tracker.last_seen(other_user.pk)
+        if last_seen is None:
+            seller_profile = getattr(other_user, 'supplier_profile', None)
+            last_seen = seller_profile.last_activity if seller_profile else None
+        if not last_seen:
             return None
 
-        return timesince(seller_profile.last_activity, timezone.now()) + " ago"
+        return timesince(last_seen, timezone.now()) + " ago"
 
 class ChatThreadCreateSerializer(serializers.ModelSerializer):
     class Meta:
@@ -256,14 +286,49 @@ class SingleProductReview(serializers.ModelSerializer):
         model = Review
         fields = ['reviewer_name', 'rating', 'comment', 'created_at']
 
-class ProductSerializerView(serializers.ModelSerializer):
+class SparseFieldsetMixin:
+    """
+    Lets list callers shape the payload from the query string: `fields=id,name,price` keeps only
+    those fields and `expand=reviews` opts in to the heavy fields listed in `expandable_fields`,
+    which are left out by default.
+    """
+    expandable_fields = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None:
+            return
+        drop = set(self.expandable_fields) - self.requested_expansions(request)
+        requested = _csv_param(request, 'fields')
+        if requested:
+            drop |= set(self.fields) - requested
+        for name in drop:
+            self.fields.pop(name, None)
+
+    @classmethod
+    def requested_expansions(cls, request):
+        return _csv_param(request, 'expand') & set(cls.expandable_fields)
+
+
+def _csv_param(request, name):
+    return {item.strip() for item in request.query_params.get(name, '').split(',') if item.strip()}
+
+
+class ProductSerializerView(SparseFieldsetMixin, serializers.ModelSerializer):
     dosage_form_name = serializers.CharField(source='dosage_form.name', read_only=True)
     reviews = SingleProductReview(many=True, read_only=True)
     userproduct_id = serializers.SerializerMethodField()
+    average_rating = serializers.SerializerMethodField()
+
+    expandable_fields = ('reviews',)
 
     class Meta:
         model = Product
-        fields = ['id', 'image', 'dosage_form_name', 'dosage_form', 'reviews', 'name', 'price', 'expire_date', 'stock_quantity', 'strength', 'userproduct_id']
+        fields = ['id', 'image', 'dosage_form_name', 'dosage_form', 'reviews', 'name', 'price', 'expire_date', 'stock_quantity', 'strength', 'userproduct_id', 'average_rating', 'rating_count']
+
+    def get_average_rating(self, obj):
+        return round(obj.average_rating, 1) if obj.rating_count else None
 
     def get_userproduct_id(self, obj):
         userproduct = getattr(obj.supplier, "user_supplier", None)
@@ -277,7 +342,7 @@ class UserSerializer(serializers.ModelSerializer):
 class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
-        fields = ['message','created_at','is_read']
+        fields = ['id', 'message','created_at','is_read', 'count']
 
 
 
@@ -315,7 +380,7 @@ class ProductProviderSerializer(serializers.ModelSerializer):
         ]
 
     def get_products(self, obj):
-        products = Product.objects.filter(supplier=obj.supplier)
+        products = obj.supplier.products.all()
         data = []
         for product in products:
             data.append({
@@ -326,11 +391,27 @@ class ProductProviderSerializer(serializers.ModelSerializer):
         return data
 
     def get_average_rating(self, product):
-        reviews = product.reviews.all()
-        if reviews.exists():
-            return round(sum(r.rating for r in reviews) / reviews.count(), 1)
-        return None
+        return round(product.average_rating, 1) if product.rating_count else None
     
+
+class ProductProviderListSerializer(serializers.ModelSerializer):
+    """
+    Slim directory entry; expects ProductProvider's list queryset (supplier joined).
+    """
+    supplier = serializers.CharField(source='supplier.name', read_only=True)
+    address = serializers.CharField(source='supplier.address', read_only=True)
+    logo = serializers.ImageField(source='supplier.logo', read_only=True)
+    average_rating = serializers.SerializerMethodField()
+    rating_count = serializers.IntegerField(source='supplier.rating_count', read_only=True)
+
+    class Meta:
+        model = UserProducts
+        fields = ['id', 'supplier', 'address', 'description', 'average_rating', 'rating_count', 'logo']
+
+    def get_average_rating(self, obj):
+        # over all reviews of the supplier's products, kept current by the Review signals
+        return round(obj.supplier.average_rating, 1) if obj.supplier.rating_count else None
+
 class SupplierUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserProducts
@@ -350,9 +431,10 @@ class OrderItemSerializer(serializers.ModelSerializer):
         product = data["product"]
         quantity = data["quantity"]
 
-        if quantity > product.stock_quantity:  # assuming Product has a 'quantity' field
+        # early feedback only; the authoritative check happens under lock in reserve_stock
+        if quantity > product.stock_quantity:
             raise serializers.ValidationError(
-                {"quantity": f"Only {product.quantity} units of {product.name} are available."}
+                {"quantity": f"Only {product.stock_quantity} units of {product.name} are available."}
             )
         return data
 
@@ -375,27 +457,28 @@ class OrderSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         items_data = validated_data.pop("items")
 
-        with transaction.atomic():
-            # Infer supplier from the first product
-            first_product = items_data[0]["product"]
-            supplier = first_product.supplier  
+        # Infer supplier from the first product
+        supplier_id = items_data[0]["product"].supplier_id
 
-            # Ensure all items have the same supplier
-            for item_data in items_data:
-                if item_data["product"].supplier != supplier:
-                    raise serializers.ValidationError(
-                        "All products in one order must be from the same supplier."
-                    )
+        # Ensure all items have the same supplier
+        if any(item_data["product"].supplier_id != supplier_id for item_data in items_data):
+            raise serializers.ValidationError(
+                "All products in one order must be from the same supplier."
+            )
 
-            order = Order.objects.create(supplier=supplier, **validated_data)
+        quantities = {}
+        for item_data in items_data:
+            product_id = item_data["product"].pk
+            quantities[product_id] = quantities.get(product_id, 0) + item_data["quantity"]
 
-            # Create order items and adjust stock
-            for item_data in items_data:
-                OrderItem.objects.create(order=order, **item_data)
+        with transaction.atomic():
+            try:
+                reserve_stock(quantities)
+            except InsufficientStock as e:
+                raise serializers.ValidationError({"quantity": str(e)})
 
-                product = item_data["product"]
-                product.stock_quantity -= item_data["quantity"]
-                product.save()
+            order = Order.objects.create(supplier_id=supplier_id, **validated_data)
+            OrderItem.objects.bulk_create([OrderItem(order=order, **item_data) for item_data in items_data])
 
         return order
 
@@ -432,33 +515,41 @@ class SupplierOrderSerializer(serializers.ModelSerializer):
 
 
     def update(self, instance, validated_data):
-        old_status = instance.status
-        new_status = validated_data.get("status", old_status)
-
-        if old_status != new_status:
-            if new_status == "cancelled":
-                instance.is_active = False  # <--- set the Order inactive
-                instance.save(update_fields=['is_active'])
-                
-                for item in instance.items.all():
-                    item.is_active = False
-                    item.save()
-                    product = item.product
-                    product.stock_quantity += item.quantity
-                    product.save()
-
-            elif old_status == "cancelled" and new_status in ["confirmed", "pending"]:
-                instance.is_active = True  # reactivate the order
-                instance.save(update_fields=['is_active'])
-                
-                for item in instance.items.all():
-                    product = item.product
-                    product.stock_quantity -= item.quantity
-                    product.save()
-
-        return super().update(instance, validated_data)
+        with transaction.atomic():
+            # compare against the locked row, not the instance loaded with the request: two
+            # concurrent cancels would otherwise both see "pending" and release stock twice
+            old_status = Order.objects.select_for_update().values_list('status', flat=True).get(pk=instance.pk)
+            new_status = validated_data.get("status", old_status)
+            if old_status != new_status:
+                if new_status == "cancelled":
+                    instance.is_active = False  # <--- set the Order inactive
+                    release_stock(order_quantities(instance))
+
+                elif old_status == "cancelled" and new_status in ["confirmed", "pending"]:
+                    instance.is_active = True  # reactivate the order
+                    try:
+                        reserve_stock(order_quantities(instance))
+                    except InsufficientStock as e:
+                        raise serializers.ValidationError({"status": str(e)})
+
+            return super().update(instance, validated_data)
 
 class ContactUsSerializer(serializers.ModelSerializer):
     class Meta:
         model = ContactUs
-        fields = ['name', 'email', 'subject', 'message']
\ No newline at end of file
+        fields = ['name', 'email', 'subject', 'message']
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    message = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImportJob
+        fields = [
+            'id', 'status', 'progress', 'total_rows', 'processed_rows',
+            'created_count', 'updated_count', 'error_count', 'errors', 'message',
+            'created_at', 'finished_at',
+        ]
+
+    def get_message(self, obj):
+        return f"Imported {obj.created_count} new products, Updated {obj.updated_count} existing products"
@@ -1,6 +1,16 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
 from django.dispatch import receiver
-from .models import ReportAbuse, Notification  # import your models
+from django.utils import timezone
+from .models import ChatMessage, DosageForm, Product, ReportAbuse, Review, Supplier  # import your models
+from .catalog import touch_catalog
+from .context_processors import supplier_cache_key
+from .notifications import notify
+from .ratings import apply_rating_change, move_product_ratings
+from .realtime import push_to_user
+from .search import refresh_search_vectors
+from .unread import adjust_unread
 # from django.core.mail import send_mail
 
 @receiver(post_save, sender=ReportAbuse)
@@ -21,12 +31,174 @@ def notify_seller_on_abuse_report(sender, instance, created, **kwargs):
         #     # send_mail(subject, message, 'no-reply@yourdomain.com', [seller.email])
 
         if seller:
-             Notification.objects.create(
-                recipient=seller.user,
-                message=f"Your product '{product.name}' has been reported. "
+             notify(
+                seller.user_id,
+                f"Your product '{product.name}' has been reported. "
                 f"Main reason: '{instance.get_reason_display()}'\n"
                 "Please review and take necessary action."
                 )
 
         else:
             print(f"Supplier {seller} has no linked user.")
+
+
+@receiver(post_init, sender=Review)
+def remember_review_rating(sender, instance, **kwargs):
+    # Snapshot what is stored so updates and deletes can apply the exact delta;
+    # reads __dict__ so deferred fields are not loaded for every instance
+    values = instance.__dict__
+    instance._stored_rating = (values.get('product_id'), values.get('rating')) if instance.pk else None
+
+
+@receiver(post_save, sender=Review)
+def update_rating_on_review_save(sender, instance, created, **kwargs):
+    stored = None if created else instance._stored_rating
+    with transaction.atomic():
+        if stored is None:
+            apply_rating_change(instance.product_id, instance.rating, 1)
+        elif stored[0] != instance.product_id:
+            apply_rating_change(stored[0], -stored[1], -1)
+            apply_rating_change(instance.product_id, instance.rating, 1)
+        else:
+            apply_rating_change(instance.product_id, instance.rating - stored[1], 0)
+    instance._stored_rating = (instance.product_id, instance.rating)
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_on_review_delete(sender, instance, **kwargs):
+    product_id, rating = instance._stored_rating or (instance.product_id, instance.rating)
+    apply_rating_change(product_id, -rating, -1)
+
+
+@receiver(post_init, sender=Product)
+def remember_product_listing(sender, instance, **kwargs):
+    values = instance.__dict__
+    instance._stored_listing = (values.get('price'), values.get('stock_quantity')) if instance.pk else None
+
+
+@receiver(post_save, sender=Product)
+def requeue_product_for_posting(sender, instance, created, **kwargs):
+    # a new price or a restock is worth announcing again; stock going down (orders) is not
+    stored = None if created else instance._stored_listing
+    values = instance.__dict__
+    if stored is not None and values.get('last_posted_at', True) is not None:
+        price, stock = stored
+        repriced = 'price' in values and price is not None and values['price'] != price
+        restocked = 'stock_quantity' in values and stock is not None and values['stock_quantity'] > stock
+        if repriced or restocked:
+            Product.objects.filter(pk=instance.pk).update(last_posted_at=None)
+            instance.last_posted_at = None
+    instance._stored_listing = (values.get('price'), values.get('stock_quantity'))
+
+
+PRODUCT_RATING_FIELDS = ('rating_sum', 'rating_count', 'average_rating')
+
+
+@receiver(pre_save, sender=Product)
+def keep_product_ratings(sender, instance, update_fields=None, **kwargs):
+    # The rating totals belong to the Review signals: a save writes back what is stored rather
+    # than a stale in-memory copy, and a product moved to another supplier takes its share of
+    # the supplier aggregates along
+    if instance._state.adding or instance.pk is None:
+        return
+    if update_fields is not None and not {'supplier', *PRODUCT_RATING_FIELDS} & set(update_fields):
+        return
+    stored = Product.objects.filter(pk=instance.pk).values('supplier_id', *PRODUCT_RATING_FIELDS).first()
+    if stored is None:
+        return
+    for field in PRODUCT_RATING_FIELDS:
+        setattr(instance, field, stored[field])
+    if stored['supplier_id'] != instance.supplier_id:
+        move_product_ratings(stored['rating_sum'], stored['rating_count'], stored['supplier_id'], instance.supplier_id)
+
+
+PRODUCT_SEARCH_FIELDS = {'name', 'strength', 'dosage_form', 'supplier'}
+
+
+@receiver(post_save, sender=Product)
+def refresh_product_search_vector(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not PRODUCT_SEARCH_FIELDS & set(update_fields):
+        return
+    refresh_search_vectors(Product.objects.filter(pk=instance.pk))
+
+
+@receiver(post_init, sender=Supplier)
+@receiver(post_init, sender=DosageForm)
+def remember_name(sender, instance, **kwargs):
+    instance._stored_name = instance.__dict__.get('name')
+
+
+@receiver(post_save, sender=Supplier)
+def refresh_supplier_search_vectors(sender, instance, created, **kwargs):
+    if not created and 'name' in instance.__dict__ and instance.name != instance._stored_name:
+        refresh_search_vectors(Product.objects.filter(supplier=instance))
+    instance._stored_name = instance.__dict__.get('name')
+
+
+@receiver(post_save, sender=DosageForm)
+def refresh_dosage_form_search_vectors(sender, instance, created, **kwargs):
+    if not created and 'name' in instance.__dict__ and instance.name != instance._stored_name:
+        refresh_search_vectors(Product.objects.filter(dosage_form=instance))
+    instance._stored_name = instance.__dict__.get('name')
+
+
+# Supplier fields shown on public pages; saves touching only others (activity, ratings, posting
+# schedule) are not catalog changes
+SUPPLIER_PAGE_FIELDS = {'user', 'name', 'phone', 'whatsapp_link', 'telegram_link', 'logo', 'address', 'response_time'}
+
+
+@receiver(pre_save, sender=Product)
+def stamp_product_update(sender, instance, update_fields=None, **kwargs):
+    # like auto_now, only written when it is among update_fields (or all fields are saved)
+    instance.updated_at = timezone.now()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def touch_catalog_on_product_change(sender, instance, **kwargs):
+    touch_catalog([instance.supplier_id])
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=DosageForm)
+@receiver(post_delete, sender=DosageForm)
+def touch_catalog_on_change(sender, instance, **kwargs):
+    # rating changes also move the supplier's updated_at (core.ratings); this covers the rest
+    touch_catalog()
+
+
+@receiver(post_save, sender=Supplier)
+@receiver(post_delete, sender=Supplier)
+def touch_catalog_on_supplier_change(sender, instance, created=False, update_fields=None, **kwargs):
+    if update_fields and not SUPPLIER_PAGE_FIELDS & set(update_fields):
+        return
+    touch_catalog([] if created or kwargs['signal'] is post_delete else [instance.pk])
+
+
+@receiver(post_init, sender=Supplier)
+def remember_supplier_user(sender, instance, **kwargs):
+    instance._stored_user_id = instance.__dict__.get('user_id')
+
+
+@receiver(post_save, sender=Supplier)
+@receiver(post_delete, sender=Supplier)
+def invalidate_supplier_profile_cache(sender, instance, update_fields=None, **kwargs):
+    # last_activity and rating updates leave the cached header fields alone
+    if update_fields and not {'name', 'logo', 'user'} & set(update_fields):
+        return
+    user_ids = {instance.user_id, instance._stored_user_id} - {None}
+    cache.delete_many([supplier_cache_key(user_id) for user_id in user_ids])
+    instance._stored_user_id = instance.user_id
+
+
+@receiver(post_save, sender=ChatMessage)
+def push_new_chat_message(sender, instance, created, **kwargs):
+    if created:
+        # imported here so registering the signals at app load does not pull in the serializers
+        from .serializers import ChatMessageSerializer
+
+        thread = instance.thread
+        push_to_user([thread.user_1_id, thread.user_2_id], 'chat.message', ChatMessageSerializer(instance).data)
+        recipient_id = thread.user_2_id if instance.sender_id == thread.user_1_id else thread.user_1_id
+        adjust_unread('messages', {recipient_id: 1})
@@ -1,6 +1,17 @@
 from django.contrib.sitemaps import Sitemap
+from django.contrib.sitemaps.views import index, sitemap
+from django.core.cache import cache
+from django.db.models import Max
+from django.http import HttpResponse
 from django.urls import reverse
-from .models import Supplier
+from django.views.decorators.http import condition
+
+from .catalog import catalog_last_modified
+from .models import Product, Supplier, UserProducts
+
+SITEMAP_PAGE_SIZE = 5000
+SITEMAP_CACHE_TIMEOUT = 24 * 3600
+
 
 class StaticViewSitemap(Sitemap):
     def items(self):
@@ -20,12 +31,72 @@ class StaticViewSitemap(Sitemap):
 class SupplierSitemap(Sitemap):
     changefreq = "weekly"
     priority = 0.6
+    limit = SITEMAP_PAGE_SIZE
+
+    def items(self):
+        # the supplier pages are addressed by their UserProducts id
+        return UserProducts.objects.order_by('pk').values('pk', 'supplier__updated_at')
+
+    def location(self, obj):
+        return reverse("landing:product-provider-detail", kwargs={"pk": obj['pk']})
+
+    def lastmod(self, obj):
+        return obj['supplier__updated_at']
+
+    def get_latest_lastmod(self):
+        return Supplier.objects.filter(user_supplier__isnull=False).aggregate(latest=Max('updated_at'))['latest']
+
+class ProductSitemap(Sitemap):
+    changefreq = "daily"
+    priority = 0.5
+    limit = SITEMAP_PAGE_SIZE
 
     def items(self):
-        return Supplier.objects.all()
+        return Product.objects.order_by('pk').values('pk', 'updated_at')
 
     def location(self, obj):
-        return reverse("landing:product-provider-detail", kwargs={"pk": obj.pk})
+        return reverse("landing:detail", kwargs={"pk": obj['pk']})
 
     def lastmod(self, obj):
-        return obj.created_at
+        return obj['updated_at']
+
+    def get_latest_lastmod(self):
+        return Product.objects.aggregate(latest=Max('updated_at'))['latest']
+
+
+sitemaps = {
+    'static': StaticViewSitemap,
+    'suppliers': SupplierSitemap,
+    'products': ProductSitemap,
+}
+
+
+def sitemap_etag(request, section=None):
+    return f'"{int(catalog_last_modified().timestamp() * 1_000_000)}"'
+
+
+def sitemap_last_modified(request, section=None):
+    return catalog_last_modified()
+
+
+@condition(etag_func=sitemap_etag, last_modified_func=sitemap_last_modified)
+def cached_sitemap(request, section=None):
+    """
+    The sitemap index (no section) or one page of a section. Each is rendered once per
+    catalog change and then served from the cache; conditional requests from crawlers get a
+    304 from the catalog timestamp alone, without touching the catalog tables.
+    """
+    key = "sitemap:{}:{}:{}:{}".format(
+        request.get_host(), section or 'index', request.GET.get('p', '1'), sitemap_etag(request),
+    )
+    content = cache.get(key)
+    if content is None:
+        if section is None:
+            response = index(request, sitemaps, sitemap_url_name='sitemap-section')
+        else:
+            response = sitemap(request, sitemaps, section=section)
+        content = response.render().content
+        cache.set(key, content, SITEMAP_CACHE_TIMEOUT)
+    response = HttpResponse(content, content_type='application/xml')
+    response.headers['X-Robots-Tag'] = 'noindex, noodp, noarchive'
+    return response
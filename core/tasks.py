@@ -1,56 +1,246 @@
-from django.utils import timezone
-from .models import Supplier, Product, SocialMediaPost
-from .telegram_utils import generate_telegram_post, send_telegram_post
 import logging
-from django.db import transaction
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from functools import reduce
+from itertools import groupby
+from operator import or_
 
-def post_next_supplier_products():
+from celery import shared_task
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from .activity import activity_tracker
+from .models import Product, SocialMediaPost, Supplier
+from .telegram_utils import TelegramError, get_post_renderer, get_telegram_client, send_telegram_post
+
+logger = logging.getLogger(__name__)
+
+POST_PRODUCT_LIMIT = 20
+SCHEDULE_BATCH_SIZE = 50
+# a claimed supplier or post still unsent after this long belongs to a run that died, and is
+# picked up again
+POST_CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+def post_dedup_key(supplier_id, day):
+    return f"{supplier_id}:{day.isoformat()}"
+
+
+def next_post_time(supplier, after):
+    """When `supplier` is next due, given that it was posted at `after`."""
+    period = timedelta(weeks=1) if supplier.post_frequency == 'weekly' else timedelta(days=1)
+    if not supplier.custom_time:
+        return after + period
+    # the first occurrence of custom_time (site time zone) at least a period minus a day away
+    earliest = timezone.localtime(after) + period - timedelta(days=1)
+    candidate = datetime.combine(earliest.date(), supplier.custom_time, tzinfo=earliest.tzinfo)
+    if candidate <= earliest:
+        candidate += timedelta(days=1)
+    return candidate
+
+
+def claim_due_suppliers(now, limit=SCHEDULE_BATCH_SIZE):
     """
-    Posts unposted products for **one supplier** per run to Telegram.
-    Retries up to 3 times if Telegram API fails.
+    Lease up to `limit` suppliers whose next_post_at has passed for POST_CLAIM_TIMEOUT, in
+    one short transaction. Rows another worker holds are skipped (SKIP LOCKED) and leased
+    suppliers are not claimed again until the lease runs out, so concurrent schedulers never
+    claim the same supplier, and a supplier whose run died before it was rescheduled (see
+    reschedule_suppliers) is picked up again rather than losing its slot.
     """
-    today = timezone.now().date()
-    # Loop through suppliers in order
-    for supplier in Supplier.objects.all().order_by("id"):
-        try:
-            # Check for unposted products
-            posted_product_ids = SocialMediaPost.objects.filter(supplier=supplier ,post_date=today).values_list('products__id', flat=True)
-            products = Product.objects.filter(supplier=supplier).exclude(id__in=posted_product_ids)[:20]
+    with transaction.atomic():
+        suppliers = list(
+            Supplier.objects.select_for_update(skip_locked=True)
+            .filter(Q(claimed_until__isnull=True) | Q(claimed_until__lte=now), next_post_at__lte=now)
+            .order_by('next_post_at')[:limit]
+        )
+        for supplier in suppliers:
+            supplier.claimed_until = now + POST_CLAIM_TIMEOUT
+        Supplier.objects.bulk_update(suppliers, ['claimed_until'])
+    return suppliers
 
-            if not products.exists():
-                continue  # Move to next supplier
 
-            # Generate post
-            post_text = generate_telegram_post(products)
-            if not post_text:
-                print(f"No post generated for supplier {supplier.name}")
-                continue
+def reschedule_suppliers(suppliers, now):
+    """Move posted (or skipped) suppliers to their next slot and end their lease."""
+    for supplier in suppliers:
+        supplier.next_post_at = next_post_time(supplier, now)
+        supplier.claimed_until = None
+    Supplier.objects.bulk_update(suppliers, ['next_post_at', 'claimed_until'])
+
+
+def queue_heads(supplier_ids, limit, queue_order):
+    """
+    Filter for the first `limit` products of each supplier's posting queue. Each supplier's
+    share is its own LIMIT read off product_post_queue_idx (a LATERAL join on PostgreSQL),
+    so the cost follows the number of suppliers, not the size of their catalogs.
+    """
+    if connection.vendor == 'postgresql':
+        table = Product._meta.db_table
+        return Q(pk__in=RawSQL(
+            f"""
+            SELECT q.id FROM unnest(%s) AS s(supplier_id)
+            CROSS JOIN LATERAL (
+                SELECT p.id FROM {table} p
+                WHERE p.supplier_id = s.supplier_id
+                ORDER BY p.last_posted_at ASC NULLS FIRST, p.id
+                LIMIT %s
+            ) q
+            """,
+            (list(supplier_ids), limit),
+        ))
+    return reduce(or_, (
+        Q(pk__in=Product.objects.filter(supplier_id=supplier_id).order_by(*queue_order).values('pk')[:limit])
+        for supplier_id in supplier_ids
+    ))
 
-            # Send to Telegram
-            send_telegram_post(post_text)
 
-            # Record post
-            with transaction.atomic():
-                tg_post = SocialMediaPost.objects.create(
-                    supplier=supplier,
-                    template_used=1,
-                    post_date=today,
-                    posted=True
-                )
-                tg_post.products.set(products)
-            tg_post.save()
+def product_batches(suppliers, limit=POST_PRODUCT_LIMIT):
+    """
+    The next `limit` products of each supplier from its posting queue: never posted first,
+    then least recently posted, so successive posts rotate through the whole catalog. One
+    query (see queue_heads). Yields (supplier, [products]) for the suppliers that have any.
+    """
+    by_id = {supplier.pk: supplier for supplier in suppliers}
+    if not by_id:
+        return
+    queue_order = [F('last_posted_at').asc(nulls_first=True), F('id').asc()]
+    products = (
+        Product.objects.defer('search_vector')
+        .filter(queue_heads(by_id, limit, queue_order))
+        .order_by('supplier_id', *queue_order)
+    )
+    for supplier_id, group in groupby(products, key=lambda product: product.supplier_id):
+        supplier = by_id[supplier_id]
+        group = list(group)
+        for product in group:
+            product.supplier = supplier
+        yield supplier, group
 
-            print(f"Posted {products.count()} products for {supplier.name}")
 
-            # **Stop after posting one supplier per run**
-            return f"Posted {products.count()} products for {supplier.name}"
+def claim_post(supplier, today):
+    """
+    Reserve the supplier's post for `today`, or resume it when an earlier run's send failed
+    or the run holding it has not finished within POST_CLAIM_TIMEOUT; None when it was
+    already posted or another run is sending it.
+    """
+    now = timezone.now()
+    key = post_dedup_key(supplier.pk, today)
+    try:
+        with transaction.atomic():
+            return SocialMediaPost.objects.create(supplier=supplier, template_used=1, dedup_key=key, claimed_at=now)
+    except IntegrityError:
+        pass
+    released = SocialMediaPost.objects.filter(
+        Q(claimed_at__isnull=True) | Q(claimed_at__lt=now - POST_CLAIM_TIMEOUT), dedup_key=key, posted=False,
+    )
+    if not released.update(claimed_at=now):
+        return None
+    post = SocialMediaPost.objects.get(dedup_key=key)
+    post.supplier = supplier
+    return post
 
-        except Exception as e:
-            print(f"Error posting for supplier {supplier.name}: {e}")
+
+def record_post(post, products):
+    with transaction.atomic():
+        post.posted = True
+        post.save(update_fields=['posted', 'sent_to'])
+        post.products.set(products)
+        # moves them to the back of the supplier's queue
+        Product.objects.filter(pk__in=[product.pk for product in products]).update(last_posted_at=timezone.now())
+    return post
+
+
+def release_post(post):
+    """Give up a failed post's claim, keeping the chats it reached for the next run to skip."""
+    post.claimed_at = None
+    post.save(update_fields=['claimed_at', 'sent_to'])
+
+
+def send_posts(batches, client, max_workers=None):
+    """
+    Send `[(post, products, text), ...]` in parallel, each only to the chats it has not
+    reached yet; returns the (post, products) that failed.
+    """
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers or settings.TELEGRAM_MAX_WORKERS) as pool:
+        futures = {
+            pool.submit(send_telegram_post, text, client, post.supplier.telegram_chat_id, post.sent_to): (post, products)
+            for post, products, text in batches
+        }
+        for future in as_completed(futures):
+            post, products = futures[future]
+            supplier = post.supplier
             try:
-                self.retry(exc=e)
-            except self.MaxRetriesExceededError:
-                print(f"Max retries exceeded for supplier {supplier.name}")
+                post.sent_to = post.sent_to + future.result()
+            except TelegramError as e:
+                logger.error(f"Error posting for supplier {supplier.name}: {e}")
+                post.sent_to = post.sent_to + e.sent
+                failed.append((post, products))
+                continue
+            record_post(post, products)
+            logger.info(f"Posted {len(products)} products for {supplier.name}")
+    return failed
+
+
+def publish_supplier_posts(client=None, now=None, max_workers=None, batch_size=SCHEDULE_BATCH_SIZE):
+    """
+    Post every supplier whose schedule is due to Telegram.
+
+    Due suppliers are claimed `batch_size` at a time (see claim_due_suppliers), so a run
+    reads only what is due however many suppliers exist, and several workers can run at once.
+    Sends run on a small thread pool sharing one pooled client, whose rate limiter keeps
+    them within Telegram's limits; database reads and writes stay on the calling thread.
+    The per-day dedup key still guards against a supplier being posted twice in one day. A
+    supplier moves to its next slot only after its post is recorded; one whose send fails
+    after retries keeps its slot and has its lease ended once the run finishes, so the next
+    run picks it up again and resumes the post, sending it only to the chats it had not
+    reached. Returns {'posted': n, 'failed': n}.
+    """
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    client = client or get_telegram_client()
+    renderer = get_post_renderer()
+    summary = {'posted': 0, 'failed': 0}
+    retry = []
+
+    while True:
+        suppliers = claim_due_suppliers(now, batch_size)
+        candidates = list(product_batches(suppliers))
+        batches = []
+        for (supplier, products), text in zip(candidates, renderer.render_many(candidates)):
+            if not text:
+                continue
+            post = claim_post(supplier, today)
+            if post is not None:
+                batches.append((post, products, text))
+        failed = send_posts(batches, client, max_workers) if batches else []
+        for post, _ in failed:
+            release_post(post)
+            retry.append(post.supplier)
+        failed_ids = {post.supplier_id for post, _ in failed}
+        reschedule_suppliers([supplier for supplier in suppliers if supplier.pk not in failed_ids], now)
+        summary['posted'] += len(batches) - len(failed)
+        summary['failed'] += len(failed)
+        if len(suppliers) < batch_size:
+            break
+
+    # released only now, so this run's loop does not claim them again
+    Supplier.objects.filter(pk__in=[supplier.pk for supplier in retry]).update(claimed_until=None)
+    return summary
+
+
+@shared_task(acks_late=True)
+def post_next_supplier_products():
+    """Publish every supplier whose schedule is due. Safe to run repeatedly or concurrently."""
+    summary = publish_supplier_posts()
+    if not summary['posted'] and not summary['failed']:
+        return "No suppliers due for posting."
+    return f"Posted for {summary['posted']} suppliers, {summary['failed']} failed"
+
 
-    print("No suppliers with unposted products today.")
-    return "No suppliers with unposted products found today."
+@shared_task
+def flush_last_activity():
+    """Write the "last seen" timestamps the web processes journalled since the last run."""
+    return f"Flushed last activity for {activity_tracker.flush()} users"
@@ -1,106 +1,219 @@
-import requests
 import logging
-import os
+import random
+import threading
+import time
+from functools import lru_cache
+
+import requests
+from django.conf import settings
+from django.template import Context, Engine
+from django.urls import reverse
+from requests.adapters import HTTPAdapter
+
 from .models import UserProducts
-from dotenv import load_dotenv
 logger = logging.getLogger(__name__)
 
 
+# Django template syntax, rendered with autoescaping because posts are sent with
+# parse_mode=HTML (a bare "&" or "<" in a product name would make Telegram reject the message)
 POST_TEMPLATES = [
-    """✨ {supplier_name} Pharmaceutical Import
+    """✨ {{ supplier.name }} Pharmaceutical Import
 🆕 Check out our latest arrivals!
-{products_list}
-
+{% for product in products %}{{ forloop.counter }}. {{ product.name }} {{ product.strength }} - {{ product.price }} ETB
+{% endfor %}
 💵 Attractive price 💵
-🚚 Free & fast delivery
-{contact_info}
-Or come to: {location}
-See full Supplier Products and order: {link_url}
+🚚 Free &amp; fast delivery
+{{ contact_info }}
+Or come to: {{ supplier.address|default:"" }}
+See full Supplier Products and order: {{ link_url }}
 
-🛒 Browse the complete catalog and order today: {catalog_url}
+🛒 Browse the complete catalog and order today: {{ catalog_url }}
 """
 ]
+POST_PRODUCT_LINES = 10
+
+
+class PostRenderer:
+    """
+    Renders Telegram posts from already loaded suppliers and products. Templates are compiled
+    once per renderer and the site URLs resolved once, so rendering a post costs no parsing
+    and no queries beyond the single directory-id lookup done per render_many() call.
+    """
+
+    def __init__(self, templates=POST_TEMPLATES, site_url=None, product_lines=POST_PRODUCT_LINES):
+        engine = Engine(autoescape=True)
+        self.templates = [engine.from_string(source) for source in templates]
+        self.site_url = (site_url or settings.SITE_URL).rstrip('/')
+        self.product_lines = product_lines
+        self.catalog_url = self.site_url + reverse('landing:landing-page')
+        self.detail_url = self.site_url + reverse('landing:product-provider-detail', args=[0]).replace('/0/', '/{}/')
+
+    def render(self, supplier, products, directory_id=None, template=0):
+        if not products:
+            return None
+        contacts = []
+        if supplier.telegram_link:
+            contacts.append(f"Telegram: {supplier.telegram_link}")
+        if supplier.whatsapp_link:
+            contacts.append(f"WhatsApp: {supplier.whatsapp_link}")
+        if supplier.phone:
+            contacts.append(f"Phone: {supplier.phone}")
+        return self.templates[template].render(Context({
+            'supplier': supplier,
+            'products': products[:self.product_lines],
+            'contact_info': "\n".join(contacts),
+            'link_url': self.detail_url.format(directory_id) if directory_id else self.catalog_url,
+            'catalog_url': self.catalog_url,
+        }))
+
+    def render_many(self, batches, template=0):
+        """Render `[(supplier, products), ...]` with one query for all the directory links."""
+        batches = list(batches)
+        directory_ids = dict(
+            UserProducts.objects.filter(supplier__in=[supplier for supplier, _ in batches])
+            .values_list('supplier_id', 'id')
+        )
+        return [
+            self.render(supplier, products, directory_ids.get(supplier.pk), template)
+            for supplier, products in batches
+        ]
+
+
+@lru_cache(maxsize=None)
+def get_post_renderer():
+    return PostRenderer()
+
 
 def generate_telegram_post(products, post_templates=POST_TEMPLATES):
     if not products:
         return None
+    renderer = get_post_renderer() if post_templates is POST_TEMPLATES else PostRenderer(post_templates)
+    return renderer.render_many([(products[0].supplier, products)])[0]
+
+
+class TelegramError(Exception):
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+        self.sent = []  # chats send_telegram_post reached before this failure
+
+    @property
+    def retryable(self):
+        # network errors, flood control (429) and server errors; other 4xx will fail again
+        return self.status is None or self.status == 429 or self.status >= 500
+
+
+class RateLimiter:
+    """
+    Spaces calls out so that at most one starts every `interval` seconds overall and every
+    `per_chat_interval` seconds per chat. Each caller reserves its slot under the lock and
+    then sleeps outside it, so concurrent senders queue up instead of bursting.
+    """
+
+    def __init__(self, interval, per_chat_interval, clock=time.monotonic, sleep=time.sleep):
+        self.interval = interval
+        self.per_chat_interval = per_chat_interval
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._next_start = 0
+        self._next_by_chat = {}
+
+    def wait(self, chat_id):
+        with self._lock:
+            now = self.clock()
+            start = max(now, self._next_start, self._next_by_chat.get(chat_id, 0))
+            self._next_start = start + self.interval
+            self._next_by_chat[chat_id] = start + self.per_chat_interval
+        if start > now:
+            self.sleep(start - now)
+
+
+class TelegramClient:
+    """
+    Bot API client over one pooled requests.Session. Safe to share between threads.
+
+    Failed sends are retried with exponential backoff (`backoff * 2 ** attempt`, plus
+    jitter); a 429 waits for Telegram's own `retry_after` instead.
+    """
 
-    supplier = products[0].supplier
-
-    # Prepare product list
-    products_list = ""
-    for idx, p in enumerate(products[:10], start=1):
-        products_list += f"{idx}. {p.name} {p.strength} - {p.price} ETB\n"
-
-    # Contact info
-    contacts = []
-    if supplier.telegram_link:
-        contacts.append(f"Telegram: {supplier.telegram_link}")
-    if supplier.whatsapp_link:
-        contacts.append(f"WhatsApp: {supplier.whatsapp_link}")
-    if supplier.phone:
-        contacts.append(f"Phone: {supplier.phone}")
-    contact_info = "\n".join(contacts)
-
-    # Pick template
-    template = post_templates[0]  # you can still random.choice(post_templates)
-
-    # Link ID fallback
-    obj = UserProducts.objects.filter(supplier=supplier).first()
-    link_url = f"http://127.0.0.1:8000/pharmacy/supplier-detail/{obj.id}/" if obj else "http://127.0.0.1:8000/pharmacy/"
-
-    catalog_url = "http://127.0.0.1:8000/pharmacy/"
-
-    text = template.format(
-        supplier_name=supplier.name,
-        products_list=products_list,
-        contact_info=contact_info,
-        location=supplier.address or "",
-        link_url=link_url,
-        catalog_url=catalog_url
-    )
-    return text
-
-def send_telegram_post(text):
+    def __init__(self, token=None, api_url=None, rate_limiter=None, max_retries=None,
+                 backoff=None, timeout=10, pool_size=None, sleep=time.sleep):
+        self.token = token or settings.TELEGRAM_BOT_TOKEN
+        self.api_url = (api_url or settings.TELEGRAM_API_URL).rstrip('/')
+        self.rate_limiter = rate_limiter or RateLimiter(
+            settings.TELEGRAM_GLOBAL_INTERVAL, settings.TELEGRAM_PER_CHAT_INTERVAL
+        )
+        self.max_retries = settings.TELEGRAM_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff = settings.TELEGRAM_RETRY_BACKOFF if backoff is None else backoff
+        self.timeout = timeout
+        self.sleep = sleep
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size or settings.TELEGRAM_MAX_WORKERS)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def send_message(self, chat_id, text, parse_mode='HTML'):
+        url = f"{self.api_url}/bot{self.token}/sendMessage"
+        payload = {'chat_id': chat_id, 'text': text, 'parse_mode': parse_mode}
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.wait(chat_id)
+            try:
+                return self._post(url, payload)
+            except TelegramError as e:
+                if not e.retryable or attempt == self.max_retries:
+                    logger.error(f"Failed to send Telegram message to {chat_id}: {e}")
+                    raise
+                delay = e.retry_after or self.backoff * 2 ** attempt + random.uniform(0, self.backoff)
+                logger.warning(f"Telegram send to {chat_id} failed ({e}), retrying in {delay:.1f}s")
+                self.sleep(delay)
+
+    def _post(self, url, payload):
+        try:
+            response = self.session.post(url, json=payload, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            raise TelegramError(str(e))
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        if response.ok and body.get('ok', True):
+            return body.get('result')
+        raise TelegramError(
+            body.get('description') or response.reason,
+            status=response.status_code,
+            retry_after=(body.get('parameters') or {}).get('retry_after'),
+        )
+
+
+@lru_cache(maxsize=None)
+def get_telegram_client():
+    """The process-wide client, so every run reuses the same connection pool."""
+    return TelegramClient()
+
+
+def telegram_destinations(extra=None):
+    chat_ids = [settings.TELEGRAM_CHAT_ID, settings.TELEGRAM_CHANNEL_ID, extra]
+    return list(dict.fromkeys(chat_id for chat_id in chat_ids if chat_id))
+
+
+def send_telegram_post(text, client=None, chat_id=None, sent=()):
     """
-    Sends a Telegram message to a supplier group and a channel.
-    Raises exception if a request fails, so Celery can retry.
+    Sends a Telegram message to the suppliers group and the channel, plus `chat_id` if given,
+    skipping the chats in `sent`. Returns the chats it sent to. Raises TelegramError once
+    retries are exhausted; its `sent` lists the chats reached before the failure.
     """
-    load_dotenv()
-    channel_id = os.getenv("TELEGRAM_CHANNEL_BOT_ID")
-    BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-    chat_id = os.getenv("TELEGRAM_BOT_ID")  # Use the passed-in link for the supplier
-
-    base_url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-
-    # 1. Send to the supplier's chat
-    payload_supplier = {
-        "chat_id": chat_id,
-        "text": text,
-        "parse_mode": "HTML"
-    }
-
-    try:
-        response_supplier = requests.post(base_url, json=payload_supplier, timeout=10)
-        response_supplier.raise_for_status()
-        logger.info(f"Telegram message sent to supplier {chat_id}")
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Failed to send Telegram message to supplier {chat_id}: {e}")
-        # Re-raise the exception so Celery's retry mechanism can take over
-        raise
-
-    # 2. Send to the channel's chat
-    payload_channel = {
-        'chat_id': channel_id,
-        "text": text,
-        'parse_mode': 'HTML',
-    }
-
-    try:
-        response_channel = requests.post(base_url, json=payload_channel, timeout=10)
-        response_channel.raise_for_status()
-        logger.info(f"Telegram message sent to channel {channel_id}")
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Failed to send Telegram message to channel {channel_id}: {e}")
-        # Re-raise the exception to be caught by Celery
-        raise
\ No newline at end of file
+    client = client or get_telegram_client()
+    delivered = []
+    for chat_id in telegram_destinations(chat_id):
+        if chat_id in sent:
+            continue
+        try:
+            client.send_message(chat_id, text)
+        except TelegramError as e:
+            e.sent = delivered
+            raise
+        delivered.append(chat_id)
+        logger.info(f"Telegram message sent to {chat_id}")
+    return delivered
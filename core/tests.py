@@ -1,3 +1,1317 @@
-from django.test import TestCase
+import csv
+import json
+import tempfile
+import threading
+from base64 import b64encode
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import openpyxl
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from channels.layers import get_channel_layer
+from django.apps import apps as django_apps
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import ExpressionWrapper, F, FloatField, Sum
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from .activity import PENDING_SEQ_KEY, ActivityTracker, pending_cache_key
+from .catalog import CatalogCache, catalog_cache
+from .checks import check_catalog_cache, check_default_cache, check_last_activity_flush
+from .consumers import UNAUTHENTICATED_CLOSE_CODE, UserEventsConsumer
+from .context_processors import supplier_cache_key, supplier_profile
+from .importers import ProductImporter, claim_import_job, run_import_job
+from .inventory import reserve_stock
+from .models import ArchivedNotification, ChatMessage, ChatThread, DosageForm, ImportJob, Notification, Order, OrderItem, Product, Review, SocialMediaPost, Supplier, UserProducts
+from .notifications import NotificationBatch, batch, broadcast, notify
+from .pagination import KeysetCursorPagination
+from .realtime import user_group
+from .retention import prune_notifications
+from .search import split_search_terms
+from .serializers import SupplierOrderSerializer
+from .sitemaps import ProductSitemap
+from .tasks import POST_CLAIM_TIMEOUT, claim_due_suppliers, claim_post, flush_last_activity, next_post_time, publish_supplier_posts
+from .telegram_utils import PostRenderer, RateLimiter, TelegramClient, TelegramError
+
+
+def make_supplier(name='Supplier', **kwargs):
+    return Supplier.objects.create(name=name, phone='0911000000', **kwargs)
+
+
+def make_product(supplier, name='Amoxicillin', **kwargs):
+    dosage_form, _ = DosageForm.objects.get_or_create(name='Tablet')
+    defaults = {
+        'product_id': f'{supplier.pk}-{name}',
+        'strength': '500mg',
+        'expire_date': date(2030, 1, 1),
+        'price': 10,
+        'stock_quantity': 100,
+        'dosage_form': dosage_form,
+    }
+    defaults.update(kwargs)
+    return Product.objects.create(name=name, supplier=supplier, **defaults)
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.supplier = make_supplier()
+        self.product = make_product(self.supplier)
+        self.other = make_product(self.supplier, name='Paracetamol')
+
+    def review(self, product, rating):
+        return Review.objects.create(product=product, reviewer_name='a', rating=rating, comment='c')
+
+    def assertRating(self, obj, rating_sum, rating_count, average):
+        obj.refresh_from_db()
+        self.assertEqual((obj.rating_sum, obj.rating_count), (rating_sum, rating_count))
+        self.assertAlmostEqual(obj.average_rating, average)
+
+    def test_create_update_delete_keep_aggregates_current(self):
+        first = self.review(self.product, 5)
+        self.review(self.product, 2)
+        self.review(self.other, 4)
+        self.assertRating(self.product, 7, 2, 3.5)
+        self.assertRating(self.supplier, 11, 3, 11 / 3)
+
+        first.rating = 3
+        first.save()
+        self.assertRating(self.product, 5, 2, 2.5)
+
+        first.product = self.other
+        first.save()
+        self.assertRating(self.product, 2, 1, 2)
+        self.assertRating(self.other, 7, 2, 3.5)
+
+        Review.objects.all().delete()
+        self.assertRating(self.product, 0, 0, 0)
+        self.assertRating(self.supplier, 0, 0, 0)
+
+    def test_moving_a_product_moves_its_ratings_between_suppliers(self):
+        self.review(self.product, 5)
+        self.review(self.other, 2)
+        buyer = make_supplier(name='Buyer')
+
+        self.product.supplier = buyer
+        self.product.save()
+        self.assertRating(self.supplier, 2, 1, 2)
+        self.assertRating(buyer, 5, 1, 5)
+
+        # a later review lands on the new supplier
+        self.review(self.product, 3)
+        self.assertRating(buyer, 8, 2, 4)
+        self.assertRating(self.supplier, 2, 1, 2)
+
+    def test_rebuild_command_recomputes_from_reviews(self):
+        self.review(self.product, 5)
+        self.review(self.other, 1)
+        Product.objects.update(rating_sum=0, rating_count=0, average_rating=0)
+        Supplier.objects.update(rating_sum=0, rating_count=0, average_rating=0)
+
+        call_command('rebuild_ratings', stdout=StringIO())
+
+        self.assertRating(self.product, 5, 1, 5)
+        self.assertRating(self.supplier, 6, 2, 3)
+
+
+class ProductProviderListTests(TestCase):
+    def add_suppliers(self, count):
+        for _ in range(count):
+            supplier = make_supplier(name=f'Supplier {Supplier.objects.count()}', address='Addis Ababa')
+            UserProducts.objects.create(supplier=supplier, description='Wholesaler')
+            for name in ('Amoxicillin', 'Paracetamol'):
+                product = make_product(supplier, name=name)
+                Review.objects.create(product=product, reviewer_name='a', rating=4, comment='c')
+
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = APIClient().get(reverse('landing:user-model-list'), {'page_size': 100})
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response.data
+
+    def test_query_count_is_constant_in_number_of_suppliers(self):
+        self.add_suppliers(2)
+        few, _ = self.count_list_queries()
+        self.add_suppliers(15)
+        many, data = self.count_list_queries()
+
+        self.assertEqual(few, many)
+        self.assertEqual(data['count'], 17)
+        self.assertEqual(data['results'][0]['average_rating'], 4.0)
+        self.assertEqual(data['results'][0]['rating_count'], 2)
+
+
+class ProductCatalogPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['catalog'].clear()
+        supplier = make_supplier()
+        UserProducts.objects.create(supplier=supplier)
+        # duplicate prices force the id tie-breaker
+        for i in range(7):
+            product = make_product(supplier, name=f'Product {i}', price=10 + i // 3)
+        Review.objects.create(product=product, reviewer_name='a', rating=5, comment='c')
+
+    def walk(self, **params):
+        client, url, seen = APIClient(), reverse('landing:products-api-view'), []
+        params.setdefault('page_size', 3)
+        while url:
+            data = client.get(url, params).data
+            seen.extend(data['results'])
+            url, params = data['next'], {}
+        return seen
+
+    def test_cursor_walk_returns_every_product_once_in_order(self):
+        for ordering in ('price', '-price', 'name', '-stock_quantity'):
+            rows = self.walk(ordering=ordering)
+            expected = Product.objects.order_by(ordering, '-id' if ordering.startswith('-') else 'id')
+            self.assertEqual([row['id'] for row in rows], [p.id for p in expected])
+
+    def test_reviews_only_when_expanded_and_fields_are_selectable(self):
+        compact = self.walk(ordering='-price')[0]
+        self.assertNotIn('reviews', compact)
+        self.assertEqual(compact['average_rating'], 5.0)
+
+        expanded = self.walk(ordering='-price', expand='reviews')[0]
+        self.assertEqual(len(expanded['reviews']), 1)
+
+        sparse = self.walk(fields='id,name')[0]
+        self.assertEqual(set(sparse), {'id', 'name'})
+
+    def test_cursor_walk_over_an_annotated_ordering(self):
+        # ties on the annotation, like equal search ranks, fall back to the id
+        queryset = Product.objects.annotate(
+            score=ExpressionWrapper(F('price') / 3, output_field=FloatField()),
+        ).order_by('-score')
+        request = Request(APIRequestFactory().get('/', {'page_size': 2}))
+        seen = []
+        while request is not None:
+            paginator = KeysetCursorPagination()
+            seen.extend(product.pk for product in paginator.paginate_queryset(queryset, request))
+            link = paginator.get_next_link()
+            request = link and Request(APIRequestFactory().get(link))
+        self.assertEqual(seen, [p.pk for p in Product.objects.order_by('-price', '-id')])
+
+    def test_invalid_cursor_is_404(self):
+        url = reverse('landing:products-api-view')
+        tampered = [['price', 'cheap', 1], ['price', '10', 'x'], ['price', None, 1], ['price', {}, 1]]
+        cursors = ['garbage'] + [b64encode(json.dumps(position).encode()).decode() for position in tampered]
+        for cursor in cursors:
+            self.assertEqual(APIClient().get(url, {'cursor': cursor}).status_code, 404, cursor)
+
+
+class ProductBulkUploadTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media = override_settings(MEDIA_ROOT=media_root.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = User.objects.create_user('supplier', 'supplier@example.com', 'pass')
+        self.supplier = make_supplier(user=self.user)
+        self.existing = make_product(self.supplier, name='Amoxicillin', price=10, stock_quantity=5)
+        DosageForm.objects.create(name='Syrup')
+
+    def workbook(self, rows):
+        wb = openpyxl.Workbook()
+        wb.active.append(['Product Name', 'Dose', 'Expiry Date', 'Unit Price', 'Stock', 'Dosage Form'])
+        for row in rows:
+            wb.active.append(row)
+        buffer = BytesIO()
+        wb.save(buffer)
+        buffer.seek(0)
+        buffer.name = 'products.xlsx'
+        return buffer
+
+    def upload(self, rows, run=True):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(reverse('landing:product-bulk-upload'), {'file': self.workbook(rows)}, format='multipart')
+        self.assertEqual(response.status_code, 202)
+        if run:
+            call_command('run_import_jobs', '--once', stdout=StringIO())
+        return client.get(response.data['status_url'])
+
+    def test_creates_updates_and_reports_row_errors(self):
+        response = self.upload([
+            ['Amoxicillin', '500mg', '2031-05-01', 12.5, 40, 'tablet'],
+            ['Paracetamol', '120mg/5ml', date(2031, 1, 1), 3, 100, 'Syrup'],
+            ['Paracetamol', '120mg/5ml', date(2031, 1, 1), 4, 90, 'Syrup'],
+            ['Ibuprofen', '200mg', '2031-01-01', 5, 10, 'Injection'],
+            ['Cetirizine', '10mg', 'not a date', 5, 10, 'Tablet'],
+            ['Vitamin C', '', '2031-01-01', 5, 10, 'Tablet'],
+            ['Zinc', '20mg', '2031-01-01', 'cheap', 10, 'Tablet'],
+        ])
+
+        self.assertEqual(response.data['status'], 'completed')
+        self.assertEqual(response.data['message'], 'Imported 1 new products, Updated 2 existing products')
+        self.assertEqual(len(response.data['errors']), 4)
+        self.assertTrue(response.data['errors'][0].startswith('Row 5: Invalid dosage form'))
+
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.price, self.existing.stock_quantity), (Decimal('12.50'), 40))
+        self.assertEqual(self.existing.expire_date, date(2031, 5, 1))
+        syrup = Product.objects.get(name='Paracetamol')
+        self.assertEqual((syrup.price, syrup.stock_quantity), (Decimal('4.00'), 90))
+
+    def test_queries_are_per_batch_not_per_row(self):
+        self.upload([[f'Drug {i}', '1mg', '2031-01-01', 1, 1, 'Tablet'] for i in range(300)], run=False)
+        with CaptureQueriesContext(connection) as ctx:
+            job = run_import_job(claim_import_job())
+        self.assertEqual((job.created_count, job.updated_count), (300, 0))
+        # the backend may split one bulk_create into a few INSERTs, never one per row
+        self.assertLess(len(ctx), 25)
+
+    def test_job_resumes_after_last_committed_row(self):
+        self.upload([[f'Drug {i}', '1mg', '2031-01-01', 1, 1, 'Tablet'] for i in range(10)], run=False)
+        # a worker committed rows 2-5 and then died
+        ImportJob.objects.update(status='running', last_row=5, created_count=4, total_rows=10)
+        ImportJob.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+
+        job = run_import_job(claim_import_job())
+
+        self.assertEqual((job.status, job.created_count, job.progress), ('completed', 10, 100))
+        self.assertEqual(Product.objects.filter(name__startswith='Drug').count(), 6)
+
+    def test_job_that_keeps_killing_its_worker_is_failed(self):
+        self.upload([['Drug', '1mg', '2031-01-01', 1, 1, 'Tablet']], run=False)
+        for attempt in range(1, ImportJob.MAX_ATTEMPTS + 1):
+            job = claim_import_job()
+            self.assertEqual((job.status, job.attempts), ('running', attempt))
+            # the worker died mid-batch
+            ImportJob.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+
+        with self.assertLogs('core.importers', 'ERROR'):
+            self.assertIsNone(claim_import_job())
+        job = ImportJob.objects.get()
+        self.assertEqual(job.status, 'failed')
+        self.assertIsNotNone(job.finished_at)
+        self.assertIn('stopped 3 times', job.errors[-1])
+
+    def test_product_export_round_trips_through_bulk_upload(self):
+        make_product(self.supplier, name='Paracetamol', price=3, stock_quantity=7)
+        self.client.force_login(self.user)
+
+        csv_response = self.client.get(reverse('landing:product-export', args=['csv']))
+        lines = b''.join(csv_response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'Name,Strength,Dosage Form,Expire Date,Price,Stock Quantity')
+        self.assertEqual(lines[1], 'Amoxicillin,500mg,Tablet,2030-01-01,10.00,5')
+
+        xlsx_response = self.client.get(reverse('landing:product-export', args=['xlsx']))
+        exported = BytesIO(b''.join(xlsx_response.streaming_content))
+        importer = ProductImporter(self.supplier).import_file(exported)
+        self.assertEqual((importer.created_count, importer.updated_count, importer.errors), (0, 2, []))
+
+
+def order_payload(*items):
+    return {
+        'customer_full_name': 'Customer',
+        'customer_email_address': 'customer@example.com',
+        'customer_phone': 911000000,
+        'customer_pharmacy_name': 'Pharmacy',
+        'customer_delivery_address': 'Addis Ababa',
+        'items': [{'product_id': product.pk, 'quantity': quantity, 'price': '10.00'} for product, quantity in items],
+    }
+
+
+class OrderStockReservationTests(TestCase):
+    def setUp(self):
+        self.supplier = make_supplier(user=User.objects.create_user('supplier'))
+        self.first = make_product(self.supplier, stock_quantity=5)
+        self.second = make_product(self.supplier, name='Paracetamol', stock_quantity=2)
+
+    def post(self, *items):
+        return APIClient().post(reverse('landing:order-creation'), order_payload(*items), format='json')
+
+    def test_order_deducts_stock_per_product(self):
+        response = self.post((self.first, 2), (self.second, 1), (self.first, 3))
+        self.assertEqual(response.status_code, 201)
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual((self.first.stock_quantity, self.second.stock_quantity), (0, 1))
+
+    def test_shortage_on_any_item_rolls_back_the_whole_order(self):
+        # each line passes validation on its own, together they exceed the stock
+        response = self.post((self.second, 1), (self.first, 3), (self.first, 3))
+        self.assertEqual(response.status_code, 400)
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual((self.first.stock_quantity, self.second.stock_quantity), (5, 2))
+        self.assertFalse(Order.objects.exists())
+
+    def test_order_export_lists_one_row_per_item(self):
+        order_id = self.post((self.first, 2), (self.second, 1)).data['order_id']
+        self.client.force_login(self.supplier.user)
+
+        response = self.client.get(reverse('landing:order-export', args=['csv']))
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0][:3], ['Order ID', 'Order Date', 'Status'])
+        self.assertEqual(
+            [(row[0], row[2], row[8], row[10]) for row in rows[1:]],
+            [(str(order_id), 'pending', 'Amoxicillin', '2'), (str(order_id), 'pending', 'Paracetamol', '1')],
+        )
+
+        response = self.client.get(reverse('landing:order-export', args=['xlsx']))
+        sheet = openpyxl.load_workbook(BytesIO(b''.join(response.streaming_content))).active
+        self.assertEqual(sheet.max_row, 3)
+        self.assertEqual(sheet.cell(2, 1).value, str(order_id))
+
+    def test_cancelling_a_stale_copy_of_a_cancelled_order_releases_nothing(self):
+        response = self.post((self.first, 2), (self.second, 1))
+        # two requests loaded the order before either cancelled it
+        copies = [Order.objects.get(pk=response.data['order_id']) for _ in range(2)]
+
+        for order in copies:
+            serializer = SupplierOrderSerializer(order, data={'status': 'cancelled'}, partial=True)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual((self.first.stock_quantity, self.second.stock_quantity), (5, 2))
+
+    def test_cancel_and_reactivate_move_stock_in_one_update_per_product(self):
+        response = self.post(*[(self.first, 1)] * 4, (self.second, 1))
+        order = Order.objects.get(pk=response.data['order_id'])
+
+        with CaptureQueriesContext(connection) as ctx:
+            serializer = SupplierOrderSerializer(order, data={'status': 'cancelled'}, partial=True)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "core_product"')]
+        self.assertEqual(len(updates), 2)
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual((self.first.stock_quantity, self.second.stock_quantity), (5, 2))
+        self.assertFalse(Order.objects.get(pk=order.pk).is_active)
+
+        serializer = SupplierOrderSerializer(order, data={'status': 'confirmed'}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.stock_quantity, 1)
+        self.assertTrue(Order.objects.get(pk=order.pk).is_active)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentOrderTests(TransactionTestCase):
+    threads = 20
+
+    def test_concurrent_orders_never_oversell(self):
+        supplier = make_supplier(user=User.objects.create_user('supplier'))
+        product = make_product(supplier, stock_quantity=10)
+        barrier = threading.Barrier(self.threads)
+        statuses = []
+
+        def place_order():
+            try:
+                barrier.wait()
+                response = APIClient().post(
+                    reverse('landing:order-creation'), order_payload((product, 1)), format='json'
+                )
+                statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=place_order) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        product.refresh_from_db()
+        self.assertEqual(statuses.count(201), 10)
+        self.assertEqual(statuses.count(400), self.threads - 10)
+        self.assertEqual(product.stock_quantity, 0)
+        self.assertEqual(OrderItem.objects.aggregate(total=Sum('quantity'))['total'], 10)
+
+
+class SupplierContextTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('supplier')
+        self.supplier = make_supplier(user=self.user, logo='supplier_logos/a.png')
+        self.client.force_login(self.user)
+
+    def test_supplier_is_cached_across_pages_and_invalidated_on_save(self):
+        response = self.client.get(reverse('landing:help'))
+        self.assertEqual(response.context['logo'].name, 'supplier_logos/a.png')
+        request = RequestFactory().get('/')
+        request.user = self.user
+        with self.assertNumQueries(0):
+            self.assertEqual(supplier_profile(request)['current_supplier'], self.supplier)
+
+        self.supplier.last_activity = timezone.now()
+        self.supplier.save(update_fields=['last_activity'])
+        self.assertIsNotNone(cache.get(supplier_cache_key(self.user.pk)))
+
+        self.supplier.logo = 'supplier_logos/b.png'
+        self.supplier.save()
+        response = self.client.get(reverse('landing:faq'))
+        self.assertEqual(response.context['logo'].name, 'supplier_logos/b.png')
+
+    def test_users_without_supplier_profile_get_no_logo(self):
+        self.client.force_login(User.objects.create_user('buyer'))
+        response = self.client.get(reverse('landing:faq'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context['logo'])
+
+
+class ActivityTrackerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tracker = ActivityTracker(interval=60)
+        self.users = [User.objects.create_user(f'user{i}') for i in range(3)]
+        for user in self.users:
+            make_supplier(user=user, name=user.username)
+
+    def test_records_are_throttled_and_flushed_in_one_update(self):
+        start = timezone.now()
+        self.assertTrue(self.tracker.record(self.users[0].pk, start))
+        self.assertFalse(self.tracker.record(self.users[0].pk, start + timedelta(seconds=30)))
+        self.assertTrue(self.tracker.record(self.users[0].pk, start + timedelta(seconds=61)))
+        self.tracker.record(self.users[1].pk, start)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.tracker.flush(), 2)
+        self.assertEqual(self.tracker.flush(), 0)
+
+        seen = dict(Supplier.objects.values_list('user_id', 'last_activity'))
+        self.assertEqual(seen[self.users[0].pk], start + timedelta(seconds=61))
+        self.assertEqual(seen[self.users[1].pk], start)
+        self.assertIsNone(seen[self.users[2].pk])
+
+    def test_presence_is_readable_before_the_flush(self):
+        now = timezone.now()
+        self.tracker.record(self.users[0].pk, now)
+        # another process only shares the cache
+        self.assertEqual(ActivityTracker(interval=60).last_seen(self.users[0].pk), now)
+        self.assertIsNone(Supplier.objects.get(user=self.users[0]).last_activity)
+
+    def test_beat_task_flushes_what_another_process_recorded(self):
+        now = timezone.now()
+        self.tracker.record(self.users[0].pk, now)
+        self.tracker.record(self.users[1].pk, now)
+
+        self.assertEqual(flush_last_activity(), 'Flushed last activity for 2 users')
+        self.assertEqual(Supplier.objects.get(user=self.users[0]).last_activity, now)
+        self.assertEqual(flush_last_activity(), 'Flushed last activity for 0 users')
+
+    def test_failed_flush_keeps_the_timestamps(self):
+        now = timezone.now()
+        self.tracker.record(self.users[0].pk, now)
+        with self.assertLogs('core.activity', 'ERROR'), mock.patch('core.activity.write_last_activity', side_effect=DatabaseError):
+            self.assertEqual(self.tracker.flush(), 0)
+        self.assertEqual(self.tracker.flush(), 1)
+        self.assertEqual(Supplier.objects.get(user=self.users[0]).last_activity, now)
+
+    def test_flush_waits_for_an_entry_still_being_written(self):
+        now = timezone.now()
+        self.tracker.record(self.users[0].pk, now)
+        # another process has taken the next sequence number but not written its entry yet
+        seq = cache.incr(PENDING_SEQ_KEY)
+        self.tracker.record(self.users[1].pk, now)
+
+        self.assertEqual(self.tracker.flush(), 1)
+        cache.set(pending_cache_key(seq), (self.users[2].pk, now))
+        self.assertEqual(self.tracker.flush(), 2)
+        self.assertFalse(Supplier.objects.filter(last_activity__isnull=True).exists())
+
+    def test_flush_skips_an_entry_missing_for_an_interval(self):
+        cache.set(PENDING_SEQ_KEY, 1, None)  # entry 1 was never written, and never will be
+        self.tracker.record(self.users[0].pk)
+        self.assertEqual(self.tracker.flush(), 0)
+        with mock.patch('core.activity.timezone.now', return_value=timezone.now() + timedelta(seconds=61)):
+            self.assertEqual(self.tracker.flush(), 1)
+
+    def test_no_flusher_thread_in_tests(self):
+        self.tracker.record(self.users[0].pk)
+        self.assertIsNone(self.tracker._flusher)
+
+    def test_deploy_checks_flag_every_per_process_cache(self):
+        locmem = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+        redis = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://redis:6379/1'}
+        with self.settings(CACHES={'default': locmem, 'catalog': locmem}):
+            self.assertEqual([w.id for w in check_catalog_cache(None) + check_default_cache(None)], ['core.W001', 'core.W003'])
+        with self.settings(CACHES={'default': redis, 'catalog': redis}):
+            self.assertEqual(check_catalog_cache(None) + check_default_cache(None), [])
+
+    def test_deploy_check_warns_when_nothing_can_flush(self):
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with self.settings(CACHES=locmem, LAST_ACTIVITY_BACKGROUND_FLUSH=False):
+            self.assertEqual([w.id for w in check_last_activity_flush(None)], ['core.W002'])
+        with self.settings(CACHES=locmem, LAST_ACTIVITY_BACKGROUND_FLUSH=True):
+            self.assertEqual(check_last_activity_flush(None), [])
+
+
+class RealtimeEventsTests(TestCase):
+    def setUp(self):
+        self.buyer = User.objects.create_user('buyer', password='x')
+        self.seller = User.objects.create_user('seller', password='x')
+        self.thread = ChatThread.objects.create(user_1=self.buyer, user_2=self.seller)
+        self.layer = get_channel_layer()
+        self.channels = {}
+        for user in (self.buyer, self.seller):
+            channel = async_to_sync(self.layer.new_channel)()
+            async_to_sync(self.layer.group_add)(user_group(user.pk), channel)
+            self.channels[user.pk] = channel
+
+    def receive(self, user):
+        return async_to_sync(self.layer.receive)(self.channels[user.pk])
+
+    def test_new_message_reaches_both_participants_with_a_notification(self):
+        client = APIClient()
+        client.force_authenticate(self.buyer)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(reverse('landing:chat-message-create'), {'thread': self.thread.pk, 'message': 'hi'})
+        self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(self.receive(self.buyer)['event'], 'chat.message')
+        events = [self.receive(self.seller) for _ in range(2)]
+        self.assertEqual({e['event'] for e in events}, {'chat.message', 'notification'})
+        message = next(e for e in events if e['event'] == 'chat.message')['data']
+        self.assertEqual((message['thread'], message['sender'], message['message']), (self.thread.pk, 'buyer', 'hi'))
+
+    def test_read_receipt_goes_to_the_sender(self):
+        ChatMessage.objects.create(thread=self.thread, sender=self.buyer, message='hi')
+        client = APIClient()
+        client.force_authenticate(self.seller)
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post(reverse('landing:mark-as-read', args=[self.thread.pk]))
+        event = self.receive(self.buyer)
+        self.assertEqual(event['event'], 'chat.read')
+        self.assertEqual(event['data'], {'thread': self.thread.pk, 'reader': 'seller'})
+
+    async def test_consumer_forwards_group_events_and_rejects_anonymous(self):
+        def socket(user):
+            scope = {'type': 'websocket', 'path': '/ws/events/', 'user': user}
+            return ApplicationCommunicator(UserEventsConsumer.as_asgi(), scope)
+
+        anonymous = socket(AnonymousUser())
+        await anonymous.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await anonymous.receive_output())['type'], 'websocket.accept')
+        self.assertEqual(await anonymous.receive_output(), {'type': 'websocket.close', 'code': UNAUTHENTICATED_CLOSE_CODE})
+
+        communicator = socket(User(pk=42, username='u'))
+        await communicator.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await communicator.receive_output())['type'], 'websocket.accept')
+        await get_channel_layer().group_send(
+            user_group(42), {'type': 'user.event', 'event': 'notification', 'data': {'message': 'm'}}
+        )
+        sent = await communicator.receive_output()
+        self.assertEqual(json.loads(sent['text']), {'type': 'notification', 'data': {'message': 'm'}})
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await communicator.wait()
+
+
+class ChatHistoryTests(TestCase):
+    def setUp(self):
+        self.buyer = User.objects.create_user('buyer', password='x')
+        self.seller = User.objects.create_user('seller', password='x')
+        make_supplier(name='Seller Pharma', user=self.seller)
+        self.thread = ChatThread.objects.create(user_1=self.buyer, user_2=self.seller)
+        self.empty = ChatThread.objects.create(user_1=self.seller, user_2=User.objects.create_user('other'))
+        # equal timestamps force the id tie-breaker
+        stamp = timezone.now()
+        for i in range(7):
+            sender = self.seller if i % 2 else self.buyer
+            ChatMessage.objects.create(thread=self.thread, sender=sender, message=f'm{i}')
+        ChatMessage.objects.filter(thread=self.thread, id__lte=ChatMessage.objects.order_by('id')[3].id).update(timestamp=stamp)
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def test_thread_list_returns_summaries(self):
+        rows = self.client.get(reverse('landing:chat-thread-list')).data
+        self.assertEqual(len(rows), 1)
+        summary = rows[0]
+        self.assertNotIn('messages', summary)
+        self.assertEqual(summary['other_party'], 'Seller Pharma')
+        self.assertEqual(summary['last_message']['message'], 'm6')
+        self.assertEqual(summary['unread_count'], 3)
+
+    def test_history_is_paged_newest_first_on_timestamp_and_id(self):
+        url, seen = reverse('landing:chat-message-list', args=[self.thread.pk]), []
+        params = {'page_size': 2}
+        while url:
+            data = self.client.get(url, params).data
+            seen.extend(row['message'] for row in data['results'])
+            url, params = data['next'], {}
+        expected = ChatMessage.objects.filter(thread=self.thread).order_by('-timestamp', '-id')
+        self.assertEqual(seen, [m.message for m in expected])
+
+    def test_history_of_someone_elses_thread_is_404(self):
+        response = self.client.get(reverse('landing:chat-message-list', args=[self.empty.pk]))
+        self.assertEqual(response.status_code, 404)
+
+
+class ChatThreadListQueryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('me')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_threads(self, count):
+        existing = ChatThread.objects.count()
+        for i in range(existing, existing + count):
+            other = User.objects.create_user(f'seller{i}')
+            supplier = make_supplier(name=f'Seller {i}', user=other, logo=f'logos/{i}.png')
+            supplier.last_activity = timezone.now()
+            supplier.save(update_fields=['last_activity'])
+            # alternate sides so both user_1 and user_2 lookups are exercised
+            thread = ChatThread.objects.create(**({'user_1': self.user, 'user_2': other} if i % 2 else {'user_1': other, 'user_2': self.user}))
+            ChatMessage.objects.create(thread=thread, sender=other, message='hello')
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            rows = self.client.get(reverse('landing:chat-thread-list')).data
+        return len(ctx), rows
+
+    def test_query_count_does_not_grow_with_threads(self):
+        self.add_threads(5)
+        few, rows = self.count_queries()
+        self.assertEqual(len(rows), 5)
+        self.add_threads(495)
+        many, rows = self.count_queries()
+        self.assertEqual(len(rows), 500)
+        self.assertEqual(few, many)
+
+        row = next(r for r in rows if r['other_party'] == 'Seller 7')
+        self.assertTrue(row['supplier_logo'].endswith('logos/7.png'))
+        self.assertIsNotNone(row['seller_last_seen'])
+        self.assertEqual(row['unread_count'], 1)
+
+
+class NotificationServiceTests(TestCase):
+    def setUp(self):
+        self.buyer = User.objects.create_user('buyer')
+        self.seller = User.objects.create_user('seller')
+        self.thread = ChatThread.objects.create(user_1=self.buyer, user_2=self.seller)
+
+    def test_message_burst_collapses_into_one_unread_notification(self):
+        client = APIClient()
+        client.force_authenticate(self.buyer)
+        for i in range(50):
+            client.post(reverse('landing:chat-message-create'), {'thread': self.thread.pk, 'message': f'm{i}'})
+
+        notification = Notification.objects.get(recipient=self.seller)
+        self.assertEqual(notification.count, 50)
+        self.assertEqual(notification.message, 'You have 50 new Messages')
+
+        # once read, the next message starts a fresh notification
+        Notification.objects.update(is_read=True)
+        client.post(reverse('landing:chat-message-create'), {'thread': self.thread.pk, 'message': 'again'})
+        fresh = Notification.objects.get(recipient=self.seller, is_read=False)
+        self.assertEqual((fresh.count, fresh.message), (1, 'You have a new Message'))
+
+    def statements(self, ctx):
+        return [q['sql'].split()[0] for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]
+
+    def test_batch_writes_with_one_insert(self):
+        users = [User.objects.create_user(f'supplier{i}') for i in range(30)]
+        with CaptureQueriesContext(connection) as ctx:
+            broadcast(users, 'Maintenance tonight')
+        self.assertEqual(self.statements(ctx), ['INSERT'])
+        self.assertEqual(Notification.objects.filter(message='Maintenance tonight').count(), 30)
+
+        notify(self.seller, 'You have a new Message', 'chat-1', 'You have {count} new Messages')
+        with CaptureQueriesContext(connection) as ctx:
+            with batch():
+                notify(self.seller, 'You have a new Message', 'chat-1', 'You have {count} new Messages')
+                notify(self.seller, 'You have a new Message', 'chat-1', 'You have {count} new Messages')
+                notify(self.buyer, 'Hello')
+        self.assertEqual(self.statements(ctx), ['SELECT', 'INSERT', 'UPDATE'])
+        self.assertEqual(Notification.objects.get(group_key='chat-1').message, 'You have 3 new Messages')
+
+    def test_group_inserted_concurrently_is_folded_into(self):
+        notify(self.seller, 'You have a new Message', 'chat-1', 'You have {count} new Messages')
+        unread_groups = NotificationBatch._unread_groups
+        calls = []
+
+        def stale_then_fresh(grouped):
+            # the first SELECT ran before the other request committed its row
+            calls.append(grouped)
+            return {} if len(calls) == 1 else unread_groups(grouped)
+
+        with mock.patch.object(NotificationBatch, '_unread_groups', side_effect=stale_then_fresh):
+            notify(self.seller, 'You have a new Message', 'chat-1', 'You have {count} new Messages')
+
+        self.assertEqual(len(calls), 2)
+        notification = Notification.objects.get(recipient=self.seller)
+        self.assertEqual((notification.count, notification.message), (2, 'You have 2 new Messages'))
+
+    def test_one_unread_row_per_group(self):
+        Notification.objects.create(recipient=self.seller, message='a', group_key='chat-1')
+        Notification.objects.create(recipient=self.seller, message='b', group_key='chat-1', is_read=True)
+        Notification.objects.create(recipient=self.seller, message='c')
+        Notification.objects.create(recipient=self.seller, message='d')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Notification.objects.create(recipient=self.seller, message='e', group_key='chat-1')
+
+
+class UnreadCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.buyer = User.objects.create_user('buyer')
+        self.seller = User.objects.create_user('seller')
+        self.thread = ChatThread.objects.create(user_1=self.buyer, user_2=self.seller)
+        self.buyer_client, self.seller_client = APIClient(), APIClient()
+        self.buyer_client.force_authenticate(self.buyer)
+        self.seller_client.force_authenticate(self.seller)
+
+    def counts(self):
+        return self.seller_client.get(reverse('landing:notification-counts')).data
+
+    def send(self, text):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.buyer_client.post(reverse('landing:chat-message-create'), {'thread': self.thread.pk, 'message': text})
+
+    def test_counters_follow_creates_and_resets_from_the_cache(self):
+        self.assertEqual(self.counts(), {'notifications': 0, 'messages': 0})
+        self.send('hi')
+        self.send('there')
+        with self.captureOnCommitCallbacks(execute=True):
+            broadcast([self.seller], 'Maintenance tonight')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.counts(), {'notifications': 2, 'messages': 2})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.seller_client.post(reverse('landing:mark-as-read', args=[self.thread.pk]))
+            self.seller_client.patch(reverse('landing:notification-view'))
+        self.assertEqual(self.counts(), {'notifications': 0, 'messages': 0})
+
+    def test_notification_list_is_paginated_newest_first(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            broadcast([self.seller] * 25, 'hello')
+        url, seen = reverse('landing:notification-view'), []
+        while url:
+            page = self.seller_client.get(url).data
+            self.assertLessEqual(len(page['results']), 20)
+            seen.extend(row['id'] for row in page['results'])
+            url = page['next']
+        self.assertEqual(seen, sorted(seen, reverse=True))
+        self.assertEqual(len(seen), 25)
+
+
+class NotificationRetentionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('seller')
+        old = timezone.now() - timedelta(days=120)
+        Notification.objects.bulk_create(
+            [Notification(recipient=self.user, message=f'old {i}', is_read=True) for i in range(7)]
+            + [Notification(recipient=self.user, message='old unread'), Notification(recipient=self.user, message='new', is_read=True)]
+        )
+        Notification.objects.exclude(message='new').update(created_at=old)
+
+    def test_prunes_old_read_notifications_in_batches(self):
+        summary = prune_notifications(older_than=timezone.now() - timedelta(days=90), batch_size=3, archive=True)
+        self.assertEqual(summary, {'deleted': 7, 'archived': 7, 'batches': 3})
+        self.assertEqual(sorted(Notification.objects.values_list('message', flat=True)), ['new', 'old unread'])
+        self.assertEqual(ArchivedNotification.objects.filter(recipient=self.user).count(), 7)
+
+    def test_command_reports_a_summary(self):
+        out = StringIO()
+        call_command('prune_notifications', '--days', '90', stdout=out)
+        self.assertIn('Pruned 7 notifications (0 archived) in 1 batches', out.getvalue())
+        self.assertFalse(ArchivedNotification.objects.exists())
+
+
+class FakeTelegramServer:
+    """A local stand-in for the Bot API: records sendMessage calls and replays scripted failures."""
+
+    def __init__(self):
+        self.messages = []
+        self.failures = []  # (status, body) answered, in order, before anything succeeds
+        lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with lock:
+                    if server.failures:
+                        status, body = server.failures.pop(0)
+                    else:
+                        server.messages.append((self.path, payload))
+                        status, body = 200, {'ok': True, 'result': {'message_id': len(server.messages)}}
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@override_settings(TELEGRAM_CHAT_ID='group', TELEGRAM_CHANNEL_ID='channel')
+class TelegramPublishingTests(TestCase):
+    def setUp(self):
+        self.server = FakeTelegramServer()
+        self.addCleanup(self.server.close)
+        self.sleeps = []
+        self.telegram = TelegramClient(
+            token='TOKEN', api_url=self.server.url, rate_limiter=RateLimiter(0, 0),
+            max_retries=3, backoff=0.5, sleep=self.sleeps.append,
+        )
+
+    def test_publishes_every_eligible_supplier_once_a_day(self):
+        busy, quiet = make_supplier(name='Busy'), make_supplier(name='Quiet')
+        make_supplier(name='Empty')
+        for i in range(25):
+            make_product(busy, name=f'Busy {i}')
+        make_product(quiet)
+
+        self.assertEqual(publish_supplier_posts(client=self.telegram), {'posted': 2, 'failed': 0})
+        self.assertEqual(len(self.server.messages), 4)
+        self.assertEqual({payload['chat_id'] for _, payload in self.server.messages}, {'group', 'channel'})
+        self.assertTrue(all(path == '/botTOKEN/sendMessage' for path, _ in self.server.messages))
+        self.assertEqual(SocialMediaPost.objects.get(supplier=busy).products.count(), 20)
+
+        # one post per supplier per day, however often the task runs
+        self.assertEqual(publish_supplier_posts(client=self.telegram), {'posted': 0, 'failed': 0})
+        self.assertEqual(len(self.server.messages), 4)
+
+    def test_retries_back_off_exponentially_and_honour_retry_after(self):
+        self.server.failures = [
+            (500, {'ok': False, 'description': 'Internal'}),
+            (502, {'ok': False, 'description': 'Bad gateway'}),
+            (429, {'ok': False, 'description': 'Too Many Requests', 'parameters': {'retry_after': 7}}),
+        ]
+        with self.assertLogs('core.telegram_utils', 'WARNING'):
+            self.telegram.send_message('group', 'hello')
+        self.assertEqual(len(self.server.messages), 1)
+        first, second, third = self.sleeps
+        self.assertTrue(0.5 <= first < 1.0 and 1.0 <= second < 1.5)
+        self.assertEqual(third, 7)
+
+    def test_client_errors_are_not_retried_and_the_supplier_stays_queued(self):
+        supplier = make_supplier()
+        make_product(supplier)
+        self.server.failures = [(400, {'ok': False, 'description': 'Bad Request: chat not found'})]
+        with self.assertLogs('core', 'ERROR'):
+            self.assertEqual(publish_supplier_posts(client=self.telegram), {'posted': 0, 'failed': 1})
+        self.assertEqual(self.sleeps, [])
+        self.assertFalse(SocialMediaPost.objects.filter(posted=True).exists())
+
+        self.server.failures = [(500, {'ok': False})] * 4
+        with self.assertLogs('core.telegram_utils', 'WARNING'), self.assertRaises(TelegramError):
+            self.telegram.send_message('group', 'hello')
+        self.assertEqual(len(self.sleeps), 3)
+
+    def test_claims_are_deduplicated_per_supplier_per_day(self):
+        supplier = make_supplier()
+        make_product(supplier)
+        today = timezone.now().date()
+        self.assertIsNotNone(claim_post(supplier, today))
+        self.assertIsNone(claim_post(supplier, today))
+        # a run that finds the supplier already claimed sends nothing
+        self.assertEqual(publish_supplier_posts(client=self.telegram), {'posted': 0, 'failed': 0})
+        self.assertEqual(self.server.messages, [])
+
+    def test_claim_left_by_a_dead_run_expires(self):
+        supplier = make_supplier()
+        today = timezone.now().date()
+        post = claim_post(supplier, today)
+        self.assertIsNone(claim_post(supplier, today))
+
+        SocialMediaPost.objects.filter(pk=post.pk).update(claimed_at=timezone.now() - POST_CLAIM_TIMEOUT - timedelta(seconds=1))
+        self.assertEqual(claim_post(supplier, today).pk, post.pk)
+        self.assertIsNone(claim_post(supplier, today))
+
+    def test_failed_send_releases_the_claim(self):
+        supplier = make_supplier()
+        make_product(supplier)
+        self.server.failures = [(403, {'ok': False, 'description': 'Forbidden'})]
+        with self.assertLogs('core', 'ERROR'):
+            publish_supplier_posts(client=self.telegram)
+        self.assertEqual(publish_supplier_posts(client=self.telegram), {'posted': 1, 'failed': 0})
+
+    def test_resumed_post_skips_chats_it_already_reached(self):
+        supplier = make_supplier()
+        make_product(supplier)
+        send_message = self.telegram.send_message
+
+        def channel_down(chat_id, text, **kwargs):
+            if chat_id == 'channel':
+                raise TelegramError('Forbidden', status=403)
+            return send_message(chat_id, text, **kwargs)
+
+        with mock.patch.object(self.telegram, 'send_message', side_effect=channel_down), self.assertLogs('core', 'ERROR'):
+            self.assertEqual(publish_supplier_posts(client=self.telegram), {'posted': 0, 'failed': 1})
+        post = SocialMediaPost.objects.get()
+        self.assertEqual((post.posted, post.sent_to, post.claimed_at), (False, ['group'], None))
+
+        self.assertEqual(publish_supplier_posts(client=self.telegram), {'posted': 1, 'failed': 0})
+        self.assertEqual([payload['chat_id'] for _, payload in self.server.messages], ['group', 'channel'])
+        post.refresh_from_db()
+        self.assertEqual((post.posted, post.sent_to), (True, ['group', 'channel']))
+
+    def test_webhook_queues_the_run(self):
+        # no broker configured in tests, so the task runs eagerly; nothing is eligible to send
+        response = self.client.get(reverse('landing:calendar-webhook'))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], 'queued')
+
+    def test_only_due_suppliers_are_claimed_and_rescheduled(self):
+        now = timezone.now()
+        due = make_supplier(name='Due', next_post_at=now - timedelta(minutes=5))
+        make_supplier(name='Later', next_post_at=now + timedelta(hours=1))
+        make_supplier(name='Paused', next_post_at=None)
+
+        self.assertEqual([supplier.pk for supplier in claim_due_suppliers(now)], [due.pk])
+        self.assertEqual(claim_due_suppliers(now), [])
+
+        # once posted, the supplier moves to its next slot and its lease ends
+        make_product(due)
+        later = now + POST_CLAIM_TIMEOUT
+        self.assertEqual(publish_supplier_posts(client=self.telegram, now=later), {'posted': 1, 'failed': 0})
+        due.refresh_from_db()
+        self.assertEqual((due.next_post_at, due.claimed_until), (later + timedelta(days=1), None))
+
+    def test_supplier_claimed_by_a_dead_run_keeps_its_slot(self):
+        now = timezone.now()
+        supplier = make_supplier(next_post_at=now - timedelta(minutes=5))
+        self.assertEqual(len(claim_due_suppliers(now)), 1)
+        # the run died before posting; the slot is still due once the lease runs out
+        self.assertEqual(claim_due_suppliers(now + timedelta(minutes=1)), [])
+        later = now + POST_CLAIM_TIMEOUT
+        self.assertEqual([s.pk for s in claim_due_suppliers(later)], [supplier.pk])
+
+    def test_next_post_time_follows_frequency_and_custom_time(self):
+        after = timezone.make_aware(datetime(2026, 3, 2, 10, 30))
+        daily = Supplier(post_frequency='daily')
+        at_nine = Supplier(post_frequency='custom', custom_time=time(9, 0))
+        weekly_at_noon = Supplier(post_frequency='weekly', custom_time=time(12, 0))
+        self.assertEqual(next_post_time(daily, after), after + timedelta(days=1))
+        self.assertEqual(next_post_time(at_nine, after), timezone.make_aware(datetime(2026, 3, 3, 9, 0)))
+        self.assertEqual(next_post_time(weekly_at_noon, after), timezone.make_aware(datetime(2026, 3, 8, 12, 0)))
+
+    def test_posts_also_go_to_the_suppliers_own_chat(self):
+        supplier = make_supplier(telegram_chat_id='@own_channel')
+        make_product(supplier)
+        make_product(make_supplier(name='Other'))
+        self.assertEqual(publish_supplier_posts(client=self.telegram, batch_size=1), {'posted': 2, 'failed': 0})
+        self.assertEqual(
+            sorted(payload['chat_id'] for _, payload in self.server.messages),
+            ['@own_channel', 'channel', 'channel', 'group', 'group'],
+        )
+
+    def test_posts_rotate_through_the_catalog(self):
+        supplier = make_supplier()
+        products = [make_product(supplier, name=f'Product {i}') for i in range(25)]
+        publish_supplier_posts(client=self.telegram)
+        publish_supplier_posts(client=self.telegram, now=timezone.now() + timedelta(days=1))
+
+        first, second = SocialMediaPost.objects.filter(supplier=supplier).order_by('pk')
+        self.assertEqual(set(first.products.all()), set(products[:20]))
+        # the five never posted come first, then the least recently posted
+        self.assertEqual(set(second.products.all()), set(products[20:] + products[:15]))
+
+    def test_price_change_or_restock_requeues_a_product(self):
+        product = make_product(make_supplier(), stock_quantity=10)
+        Product.objects.filter(pk=product.pk).update(last_posted_at=timezone.now())
+
+        product = Product.objects.get(pk=product.pk)
+        product.stock_quantity = 5  # sold, not worth a new post
+        product.save()
+        self.assertIsNotNone(Product.objects.get(pk=product.pk).last_posted_at)
+
+        product = Product.objects.get(pk=product.pk)
+        product.price += 1
+        product.save(update_fields=['price'])
+        self.assertIsNone(Product.objects.get(pk=product.pk).last_posted_at)
+
+    def test_renders_many_suppliers_with_one_query_and_escapes_html(self):
+        listed = make_supplier(name='Listed & Co', address='Bole <Road>')
+        unlisted = make_supplier(name='Unlisted')
+        directory = UserProducts.objects.create(supplier=listed)
+        batches = [
+            (listed, [make_product(listed, name='Amox <500>')]),
+            (unlisted, [make_product(unlisted)]),
+        ]
+        renderer = PostRenderer(site_url='https://pharmacy.example/')
+        with self.assertNumQueries(1):
+            listed_post, unlisted_post = renderer.render_many(batches)
+        self.assertIn('Listed &amp; Co', listed_post)
+        self.assertIn('1. Amox &lt;500&gt;', listed_post)
+        self.assertIn('Bole &lt;Road&gt;', listed_post)
+        self.assertIn(f'https://pharmacy.example{reverse("landing:product-provider-detail", args=[directory.pk])}', listed_post)
+        self.assertIn(f'order: https://pharmacy.example{reverse("landing:landing-page")}', unlisted_post)
+
+    def test_rate_limiter_spaces_sends_globally_and_per_chat(self):
+        sleeps = []
+        limiter = RateLimiter(1, 3, clock=lambda: 0, sleep=sleeps.append)
+        for chat_id in ('a', 'a', 'b', 'c'):
+            limiter.wait(chat_id)
+        self.assertEqual(sleeps, [3, 4, 5])
+
+
+class SitemapTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.supplier = make_supplier()
+        self.directory = UserProducts.objects.create(supplier=self.supplier)
+        self.products = [make_product(self.supplier, name=f'Product {i}') for i in range(3)]
+
+    def test_index_links_paginated_sections(self):
+        with mock.patch.object(ProductSitemap, 'limit', 2):
+            index = self.client.get(reverse('sitemap')).content.decode()
+            self.assertIn(reverse('sitemap-section', args=['products']) + '?p=2', index)
+            self.assertIn(reverse('sitemap-section', args=['suppliers']), index)
+
+            page = self.client.get(reverse('sitemap-section', args=['products']), {'p': 2}).content.decode()
+        self.assertIn(reverse('landing:detail', args=[self.products[2].pk]), page)
+        self.assertNotIn(reverse('landing:detail', args=[self.products[0].pk]), page)
+
+        suppliers = self.client.get(reverse('sitemap-section', args=['suppliers'])).content.decode()
+        self.assertIn(reverse('landing:product-provider-detail', args=[self.directory.pk]), suppliers)
+
+    def test_bulk_created_products_carry_a_lastmod(self):
+        # bulk_create skips the save signal, so the stamp comes from the field default
+        source = self.products[0]
+        Product.objects.bulk_create([Product(
+            supplier=source.supplier, dosage_form=source.dosage_form, product_id='bulk', name='Bulk',
+            strength=source.strength, expire_date=source.expire_date, price=source.price,
+            stock_quantity=source.stock_quantity,
+        )])
+        self.assertFalse(Product.objects.filter(updated_at__isnull=True).exists())
+        self.assertIn('<lastmod>', self.client.get(reverse('sitemap-section', args=['products'])).content.decode())
+
+    def test_served_from_cache_and_conditional_requests_get_304(self):
+        url = reverse('sitemap-section', args=['products'])
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).content, first.content)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified']).status_code, 304)
+
+    def test_catalog_changes_move_last_modified(self):
+        url = reverse('sitemap')
+        etag = self.client.get(url)['ETag']
+        self.supplier.refresh_from_db()
+        updated_at = self.supplier.updated_at
+
+        self.supplier.last_activity = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.supplier.save(update_fields=['last_activity'])
+        self.assertEqual(self.client.get(url)['ETag'], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[0].delete()
+        self.supplier.refresh_from_db()
+        self.assertGreater(self.supplier.updated_at, updated_at)
+        self.assertNotEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class CatalogConditionalResponseTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['catalog'].clear()
+        self.client = APIClient()
+        self.product = make_product(make_supplier())
+
+    def test_unchanged_catalog_answers_304_without_queries(self):
+        for url in (
+            reverse('landing:products-api-view'),
+            reverse('landing:api-product-detail', args=[self.product.pk]),
+            reverse('landing:dosage'),
+        ):
+            first = self.client.get(url)
+            self.assertEqual(first.status_code, 200)
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+                self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified']).status_code, 304)
+
+    def test_product_and_review_writes_change_the_etag(self):
+        url = reverse('landing:api-product-detail', args=[self.product.pk])
+        etag = self.client.get(url)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(product=self.product, reviewer_name='a', rating=4, comment='c')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['reviews']), 1)
+
+        etag = response['ETag']
+        self.product.price = 12
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_orders_and_cancellations_change_the_etag(self):
+        product = make_product(make_supplier(user=User.objects.create_user('supplier')), name='Paracetamol')
+        url = reverse('landing:products-api-view')
+        etag = self.client.get(url)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('landing:order-creation'), order_payload((product, 3)), format='json')
+        order_id = response.data['order_id']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        stock = {row['name']: row['stock_quantity'] for row in response.json()['results']}
+        self.assertEqual(stock['Paracetamol'], 97)
+
+        serializer = SupplierOrderSerializer(Order.objects.get(pk=order_id), data={'status': 'cancelled'}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            serializer.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['catalog'].clear()
+        catalog_cache.stats.clear()
+        self.client = APIClient()
+        self.supplier = make_supplier()
+        self.product = make_product(self.supplier, name='Amoxicillin')
+        make_product(self.supplier, name='Paracetamol', price=5)
+        self.url = reverse('landing:products-api-view')
+
+    def test_equivalent_queries_share_one_cached_page(self):
+        first = self.client.get(self.url, {'search': 'Amox', 'ordering': 'price', 'utm_source': 'x'})
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url, {'ordering': ' price,bogus', 'search': '  amox '})
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(catalog_cache.stats, {'hits': 1, 'misses': 1})
+
+        # different filters are different entries
+        self.assertEqual(self.client.get(self.url, {'price__lte': 6})['X-Cache'], 'MISS')
+
+    def test_catalog_writes_retire_cached_pages(self):
+        self.assertEqual(len(self.client.get(self.url).json()['results']), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            make_product(self.supplier, name='Ibuprofen')
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.json()['results']), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(product=self.product, reviewer_name='a', rating=5, comment='c')
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'MISS')
+
+        self.supplier.name = 'Renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.supplier.save()
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'MISS')
+
+    def test_order_retires_cached_pages_with_old_stock(self):
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'MISS')
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_stock({self.product.pk: 40})
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        stock = {row['name']: row['stock_quantity'] for row in response.json()['results']}
+        self.assertEqual(stock['Amoxicillin'], 60)
+
+    def test_hit_rate_is_logged(self):
+        counted = CatalogCache(log_every=2)
+        with self.assertLogs('core.catalog', 'INFO') as logs:
+            counted.get_or_compute('key', lambda: 'value')
+            counted.get_or_compute('key', lambda: 'value')
+        self.assertEqual(logs.output, ['INFO:core.catalog:Catalog cache: 2 lookups, 1 hits (50%), 1 misses, 0 waited for a fill'])
+
+    def test_waits_for_a_concurrent_fill_instead_of_recomputing(self):
+        store = caches['catalog']
+        store.add('key:lock', 1)
+        waiting = CatalogCache(sleep=lambda seconds: store.set('key', 'filled'))
+        self.assertEqual(waiting.get_or_compute('key', lambda: self.fail('computed twice')), ('filled', True))
+        self.assertEqual(waiting.stats, {'hits': 1, 'waits': 1})
+
+        # a lock holder that never delivers only delays the caller
+        store.delete('key')
+        giving_up = CatalogCache(sleep=lambda seconds: None)
+        self.assertEqual(giving_up.get_or_compute('key', lambda: 'computed'), ('computed', False))
+
+
+class SearchCatalogMixin:
+    def setUp(self):
+        cache.clear()
+        caches['catalog'].clear()
+        self.supplier = make_supplier(name='Ethio Pharma')
+        make_product(self.supplier, name='Co-Amoxiclav')
+        make_product(self.supplier, name='Amoxicillin')
+        make_product(make_supplier(name='Amox Traders'), name='Zinc')
+
+    def search(self, text, **params):
+        response = APIClient().get(reverse('landing:products-api-view'), {'search': text, **params})
+        return [row['name'] for row in response.json()['results']]
+
+
+class ProductSearchTests(SearchCatalogMixin, TestCase):
+    def test_terms_are_split_on_non_word_characters(self):
+        self.assertEqual(split_search_terms(['co-amoxiclav', '500mg,', '--']), ['co', 'amoxiclav', '500mg'])
+
+    def test_matches_product_and_supplier_names(self):
+        self.assertEqual(self.search('amoxic', ordering='name'), ['Amoxicillin', 'Co-Amoxiclav'])
+        self.assertEqual(self.search('ethio', ordering='name'), ['Amoxicillin', 'Co-Amoxiclav'])
+
+
+@skipUnless(connection.vendor == 'postgresql', "ranked full-text search needs PostgreSQL")
+class PostgresProductSearchTests(SearchCatalogMixin, TestCase):
+    def test_hyphenated_names_match(self):
+        self.assertEqual(self.search('co-amoxiclav'), ['Co-Amoxiclav'])
+
+    def test_misspelled_names_match_by_trigram(self):
+        self.assertIn('Amoxicillin', self.search('amoxicilin'))
+
+    def test_name_matches_rank_above_supplier_matches(self):
+        results = self.search('amox')
+        self.assertEqual(set(results[:2]), {'Amoxicillin', 'Co-Amoxiclav'})
+        self.assertEqual(results[2:], ['Zinc'])
+
+    def test_ranked_results_page_with_the_cursor(self):
+        for i in range(5):
+            make_product(self.supplier, name=f'Amoxil {i}')
+        client, url = APIClient(), reverse('landing:products-api-view')
+        params, seen = {'search': 'amox', 'page_size': 2}, []
+        while url:
+            response = client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(row['name'] for row in response.data['results'])
+            url, params = response.data['next'], {}
+        self.assertEqual(seen, self.search('amox', page_size=100))
+        self.assertEqual(len(seen), 8)
+
+    def test_renames_refresh_search_vectors(self):
+        self.supplier.name = 'Addis Medical'
+        self.supplier.save()
+        self.assertEqual(self.search('addis', ordering='name'), ['Amoxicillin', 'Co-Amoxiclav'])
+
+        dosage_form = DosageForm.objects.get(name='Tablet')
+        dosage_form.name = 'Capsule'
+        dosage_form.save()
+        self.assertEqual(len(self.search('capsule')), 3)
+
+    def test_migration_backfills_search_vectors(self):
+        backfill = import_module('core.migrations.0034_product_search_vector_and_more').backfill_search_vectors
+        Product.objects.update(search_vector=None)
+        backfill(django_apps, SimpleNamespace(connection=connection))
+        self.assertFalse(Product.objects.filter(search_vector__isnull=True).exists())
+        self.assertEqual(self.search('ethio', ordering='name'), ['Amoxicillin', 'Co-Amoxiclav'])
@@ -0,0 +1,58 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from .models import ChatMessage, Notification
+
+UNREAD_CACHE_TIMEOUT = 24 * 3600
+UNREAD_KINDS = ('notifications', 'messages')
+
+
+def unread_cache_key(kind, user_id):
+    return f"unread:{kind}:{user_id}"
+
+
+def count_unread(kind, user_id):
+    """The authoritative count, used to (re)fill the cache."""
+    if kind == 'notifications':
+        return Notification.objects.filter(recipient_id=user_id, is_read=False).count()
+    return ChatMessage.objects.filter(
+        Q(thread__user_1_id=user_id) | Q(thread__user_2_id=user_id), is_read=False
+    ).exclude(sender_id=user_id).count()
+
+
+def get_unread_counts(user_id):
+    """`{'notifications': n, 'messages': m}` from the cache, counting only what is missing."""
+    keys = {kind: unread_cache_key(kind, user_id) for kind in UNREAD_KINDS}
+    cached = cache.get_many(keys.values())
+    counts = {}
+    for kind, key in keys.items():
+        value = cached.get(key)
+        # a negative value means a decrement raced a refill; recount rather than trust it
+        if value is None or value < 0:
+            value = count_unread(kind, user_id)
+            cache.set(key, value, UNREAD_CACHE_TIMEOUT)
+        counts[kind] = value
+    return counts
+
+
+def adjust_unread(kind, deltas):
+    """Shift the cached counters by `{user_id: delta}` once the current transaction commits."""
+    deltas = {user_id: delta for user_id, delta in deltas.items() if user_id is not None and delta}
+    if not deltas:
+        return
+
+    def apply():
+        for user_id, delta in deltas.items():
+            try:
+                cache.incr(unread_cache_key(kind, user_id), delta)
+            except ValueError:
+                # not cached: the next read counts from the database, which already has this change
+                pass
+
+    transaction.on_commit(apply)
+
+
+def reset_unread(kind, user_id):
+    # dropped rather than set to 0, so a row created while marking everything read is not lost
+    transaction.on_commit(lambda: cache.delete(unread_cache_key(kind, user_id)))
@@ -1,6 +1,6 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
-from .views import google_calendar_webhook, ChatMessageCreateAPIView, ChatThreadCreateAPIView, ChatThreadListAPIView, ContactUsViewSet, CustomerDashboardView, FAQView, HelpPageView, MarkMessagesAsReadView, MessageView, NotificationApi, Pharmacy_page,ProductApiView,DosageApi, ProductBulkUploadView, ProductDetailAPIView, ProductProvider, ProductProviderDetailPage, ProductViewSet, ProductsView, ProfilePageView, ReportAbuseCreateAPIView, ReviewCreateAPIView,ProductDetailView, SignUpPageView, SupplierOrderDetailPage, SupplierProfileViewSet, SupplierSignupAPIView, UserLoginAPIView, UserOrderDetailUpdateView, UserOrdersListView, UserProfileAPIView, logout_view, ProductProviderListPage,OrderCreateView, SupplierOrderPage
+from .views import google_calendar_webhook, ChatMessageCreateAPIView, ChatMessageListAPIView, ChatThreadCreateAPIView, ChatThreadListAPIView, ContactUsViewSet, CustomerDashboardView, FAQView, HelpPageView, ImportJobStatusAPIView, MarkMessagesAsReadView, OrderExportView, ProductExportView, MessageView, NotificationApi, Pharmacy_page,ProductApiView,DosageApi, ProductBulkUploadView, ProductDetailAPIView, ProductProvider, ProductProviderDetailPage, ProductViewSet, ProductsView, UnreadCountsAPIView, ProfilePageView, ReportAbuseCreateAPIView, ReviewCreateAPIView,ProductDetailView, SignUpPageView, SupplierOrderDetailPage, SupplierProfileViewSet, SupplierSignupAPIView, UserLoginAPIView, UserOrderDetailUpdateView, UserOrdersListView, UserProfileAPIView, logout_view, ProductProviderListPage,OrderCreateView, SupplierOrderPage
 
 
 app_name = 'landing'
@@ -22,11 +22,13 @@ urlpatterns = [
     # Chat API endpoints 
 
     path('thread/<int:thread_pk>/mark-as-read/', MarkMessagesAsReadView.as_view(), name='mark-as-read'),
+    path('thread/<int:thread_pk>/messages/', ChatMessageListAPIView.as_view(), name='chat-message-list'),
     path('threads/', ChatThreadListAPIView.as_view(), name='chat-thread-list'),
     path('threads/create/', ChatThreadCreateAPIView.as_view(), name='chat-thread-create'),
     path('messages/create/', ChatMessageCreateAPIView.as_view(), name='chat-message-create'),
     path('message/', MessageView.as_view(), name='message-view'),
     path('api/notification/', NotificationApi.as_view(),name='notification-view'),
+    path('api/notification/counts/', UnreadCountsAPIView.as_view(), name='notification-counts'),
 
     # Views for the web pages
     path('user/signup/', SignUpPageView.as_view(), name='user-signup'),
@@ -49,6 +51,9 @@ urlpatterns = [
     path('orders/view/', SupplierOrderPage.as_view(), name='order-view'),
     path('order/<uuid:pk>/', SupplierOrderDetailPage.as_view(), name='order-detail'),
     path("products/bulk-upload/", ProductBulkUploadView.as_view(), name="product-bulk-upload"),
+    path("products/bulk-upload/<uuid:pk>/", ImportJobStatusAPIView.as_view(), name="product-bulk-upload-status"),
+    path("products/export/<str:file_format>/", ProductExportView.as_view(), name="product-export"),
+    path("orders/export/<str:file_format>/", OrderExportView.as_view(), name="order-export"),
 
     path('api/', include(router.urls)),
     path('faq/',FAQView.as_view(),name='faq'),
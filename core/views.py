@@ -1,17 +1,27 @@
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
 from django.views import View
 from rest_framework.permissions import AllowAny
 from rest_framework import generics
 from rest_framework.filters import SearchFilter,OrderingFilter
-from .models import ChatMessage, ChatThread, ContactUs, DosageForm, Order, Product, ReportAbuse, Review, Supplier, Notification, UserProducts
+from .models import ChatMessage, ChatThread, ContactUs, DosageForm, ImportJob, Order, Product, ReportAbuse, Review, Supplier, Notification, UserProducts
+from .catalog import CatalogConditionalMixin, catalog_cache, catalog_query_key
+from .exporters import CONTENT_TYPES, ORDER_COLUMNS, PRODUCT_COLUMNS, export_response, order_rows, product_rows
 from .filters import ProductFilter
-from .serializers import ChatMessageSerializer, ChatThreadCreateSerializer, ChatThreadSerializer, ContactUsSerializer, DosageFormSerializer, NotificationSerializer, OrderSerializer, ProductDetailSerializer, ProductProviderSerializer, ProductSerializerView, SupplierOrderSerializer, SupplierUpdateSerializer, ReportAbuseSerializer, ReviewSerializer, SupplierSignupSerializer, UserSerializer
+from .importers import ProductImporter
+from .notifications import notify
+from .pagination import ChatMessagePagination, KeysetCursorPagination, NotificationPagination, ProductProviderPagination
+from .realtime import push_to_user
+from .search import ProductSearchFilter
+from .unread import adjust_unread, get_unread_counts, reset_unread
+from .serializers import ChatMessageSerializer, ChatThreadCreateSerializer, ChatThreadSerializer, ContactUsSerializer, DosageFormSerializer, ImportJobSerializer, NotificationSerializer, OrderSerializer, ProductDetailSerializer, ProductProviderListSerializer, ProductProviderSerializer, ProductSerializerView, SupplierOrderSerializer, SupplierUpdateSerializer, ReportAbuseSerializer, ReviewSerializer, SupplierSignupSerializer, UserSerializer
 from django_filters.rest_framework import DjangoFilterBackend
 from django.views.generic import TemplateView
 from rest_framework import  permissions
 from django.shortcuts import get_object_or_404
-from django.db.models import Q, Avg
+from django.db.models import Count, F, Max, Prefetch, Q
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
@@ -21,9 +31,6 @@ from django.contrib.auth import logout
 import uuid
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.db import transaction
-import openpyxl
-from django.core.files.storage import default_storage
-from dateutil import parser
 
 
 def logout_view(request):
@@ -34,11 +41,7 @@ class Pharmacy_page(View):
     template_name = 'pharmacy.html'
 
     def get(self, request):
-        supplier = Supplier.objects.filter(user=request.user.id).first()
-        context = {
-            "logo": supplier.logo if supplier and supplier.logo else None,
-        }
-        return render(request, self.template_name, context)
+        return render(request, self.template_name)
 
 class ProductDetailView(View):
     template_name = 'detail.html'
@@ -61,13 +64,14 @@ class ProductDetailView(View):
 #         response.data["userproduct_id"] = userproduct.id if userproduct else None
 #         return response
 
-class ProductApiView(generics.ListAPIView):
-    queryset = Product.objects.all()
+class ProductApiView(CatalogConditionalMixin, generics.ListAPIView):
+    queryset = Product.objects.defer('search_vector')
     serializer_class = ProductSerializerView
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    pagination_class = KeysetCursorPagination
+    filter_backends = [DjangoFilterBackend, OrderingFilter, ProductSearchFilter]
     filterset_class = ProductFilter
 
-    # Search fields
+    # Ranked full-text search on PostgreSQL; plain icontains over these fields elsewhere
     search_fields = [
         'name',
         'supplier__name',
@@ -78,7 +82,23 @@ class ProductApiView(generics.ListAPIView):
     ordering_fields = ['price', 'stock_quantity', 'name']
     ordering = ['price']  # default order
 
-class DosageApi(generics.ListAPIView):
+    def get_queryset(self):
+        queryset = super().get_queryset().select_related('dosage_form', 'supplier__user_supplier')
+        if 'reviews' in self.serializer_class.requested_expansions(self.request):
+            queryset = queryset.prefetch_related('reviews')
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        # anonymous visitors all see the same pages, so those are served through the catalog cache
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        compute = super().list
+        data, hit = catalog_cache.get_or_compute(
+            catalog_query_key(self, request), lambda: compute(request, *args, **kwargs).data,
+        )
+        return Response(data, headers={'X-Cache': 'HIT' if hit else 'MISS'})
+
+class DosageApi(CatalogConditionalMixin, generics.ListAPIView):
     queryset = DosageForm.objects.all()
     serializer_class = DosageFormSerializer
 
@@ -89,11 +109,9 @@ class ReviewCreateAPIView(generics.CreateAPIView):
     def get(self,request):
         message = 'You just got a new review!!'
         user = self.request.user
-        Notification.objects.create(recipient=user,
-                                    message= message
-                                    )
+        notify(user, message)
 
-class ProductDetailAPIView(generics.RetrieveAPIView):
+class ProductDetailAPIView(CatalogConditionalMixin, generics.RetrieveAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductDetailSerializer
 
@@ -106,13 +124,6 @@ class MessageView(LoginRequiredMixin,TemplateView):
     login_url = '/user/signup/'
     template_name = 'message.html'
 
-    def get(self, request):
-        supplier = Supplier.objects.filter(user=request.user.id).first()
-        context = {
-            "logo": supplier.logo if supplier and supplier.logo else None,
-        }
-        return render(request, self.template_name, context)
-
 class CustomerDashboardView(LoginRequiredMixin,TemplateView):
     login_url = '/user/signup/'
     template_name = 'dashboard.html'
@@ -125,9 +136,8 @@ class CustomerDashboardView(LoginRequiredMixin,TemplateView):
             context["dashboard"] = Product.objects.filter(supplier__user=user)[:10]
             # Stats
             context["count_products"] = Product.objects.filter(supplier__user=user).count()
-            supplier = Supplier.objects.filter(user=user).first()
-            context['reviews'] = supplier.average_rating if supplier else 0
-            context['logo'] = supplier.logo if supplier.logo else None
+            average_rating = Supplier.objects.filter(user=user).values_list('average_rating', flat=True).first()
+            context['reviews'] = round(average_rating, 2) if average_rating else 0
         else:
             context["dashboard"] = []
             context["count_products"] = 0
@@ -151,7 +161,29 @@ class ChatThreadListAPIView(generics.ListAPIView):
 
     def get_queryset(self):
         user = self.request.user
-        return ChatThread.objects.filter(Q(user_1=user) | Q(user_2=user))
+        return ChatThread.objects.filter(Q(user_1=user) | Q(user_2=user)).select_related(
+            'user_1__supplier_profile', 'user_2__supplier_profile',
+        ).annotate(
+            unread_count=Count('messages', filter=Q(messages__is_read=False) & ~Q(messages__sender=user)),
+            last_message_at=Max('messages__timestamp'),
+        ).prefetch_related(Prefetch(
+            'messages',
+            queryset=ChatMessage.objects.select_related('sender').order_by('-timestamp', '-id')[:1],
+            to_attr='latest_messages',
+        )).order_by(F('last_message_at').desc(nulls_last=True), '-created_at')
+
+class ChatMessageListAPIView(generics.ListAPIView):
+    """A thread's history, newest first, in keyset pages on (timestamp, id)."""
+    serializer_class = ChatMessageSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ChatMessagePagination
+
+    def get_queryset(self):
+        user = self.request.user
+        thread = get_object_or_404(
+            ChatThread.objects.filter(Q(user_1=user) | Q(user_2=user)), pk=self.kwargs['thread_pk']
+        )
+        return ChatMessage.objects.filter(thread=thread).select_related('sender').order_by('-timestamp')
 
 class ChatMessageCreateAPIView(generics.CreateAPIView):
     serializer_class = ChatMessageSerializer
@@ -163,10 +195,13 @@ class ChatMessageCreateAPIView(generics.CreateAPIView):
         if user != thread.user_1 and user != thread.user_2:
             raise PermissionError("You are not allowed to send messages in this thread.")
         serializer.save(sender=user)
-        Notification.objects.create(
-            recipient=thread.user_1 if user != thread.user_1 else thread.user_2,
-            message= 'You have a new Message',
-        ).save()
+        # a burst of messages in one thread stays a single unread notification
+        notify(
+            thread.user_1_id if user.pk != thread.user_1_id else thread.user_2_id,
+            'You have a new Message',
+            group_key=f'chat-thread-{thread.pk}',
+            group_message='You have {count} new Messages',
+        )
 
 class MarkMessagesAsReadView(APIView):
     def post(self, request, thread_pk):
@@ -184,6 +219,10 @@ class MarkMessagesAsReadView(APIView):
         ).exclude(
             sender=user
         ).update(is_read=True)
+        if unread_msgs_count:
+            adjust_unread('messages', {user.pk: -unread_msgs_count})
+            other_user_id = thread.user_2_id if user.pk == thread.user_1_id else thread.user_1_id
+            push_to_user(other_user_id, 'chat.read', {'thread': thread.pk, 'reader': user.username})
 
         return Response(
             {"detail": f"{unread_msgs_count} messages marked as read."},
@@ -194,13 +233,6 @@ class ProfilePageView(LoginRequiredMixin,TemplateView):
     login_url = '/user/signup/'
     template_name = 'profile.html'
 
-    def get(self, request):
-        supplier = Supplier.objects.filter(user=request.user.id).first()
-        context = {
-            "logo": supplier.logo if supplier and supplier.logo else None,
-        }
-        return render(request, self.template_name, context)
-
 class UserProfileAPIView(generics.RetrieveUpdateAPIView):
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -210,33 +242,16 @@ class UserProfileAPIView(generics.RetrieveUpdateAPIView):
 
     def perform_update(self, serializer):
         serializer.save()
-        Notification.objects.create(
-            recipient=self.request.user,
-            message="Your profile has been updated successfully."
-        )
+        notify(self.request.user, "Your profile has been updated successfully.", group_key='profile-updated')
     
 class HelpPageView(LoginRequiredMixin,TemplateView):
     login_url = '/user/signup/'
     template_name = 'help.html'
 
-    def get(self, request):
-        supplier = Supplier.objects.filter(user=request.user.id).first()
-        context = {
-            "logo": supplier.logo if supplier and supplier.logo else None,
-        }
-        return render(request, self.template_name, context)
-
 class ProductsView(LoginRequiredMixin,TemplateView):
     login_url = '/user/signup/'
     template_name = 'products.html'
 
-    def get(self, request):
-        supplier = Supplier.objects.filter(user=request.user.id).first()
-        context = {
-            "logo": supplier.logo if supplier and supplier.logo else None,
-        }
-        return render(request, self.template_name, context)
-
 class SignUpPageView(TemplateView):
     template_name = 'signup/sighup.html'
 
@@ -288,6 +303,7 @@ class ProductViewSet(viewsets.ModelViewSet):
 class NotificationApi(generics.ListAPIView):
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = NotificationPagination
 
     def get_queryset(self):
         user = self.request.user
@@ -298,30 +314,36 @@ class NotificationApi(generics.ListAPIView):
     def patch(self, request, *args, **kwargs):
         unread_qs = Notification.objects.filter(recipient=request.user.id, is_read=False)
         unread_qs.update(is_read=True)
+        reset_unread('notifications', request.user.pk)
         return Response({"detail": "All notifications marked as read."}, status=status.HTTP_200_OK)
 
+class UnreadCountsAPIView(APIView):
+    """Badge counts for the header, served from the cached counters."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        return Response(get_unread_counts(request.user.pk))
+
 class ProductProvider(viewsets.ModelViewSet):
     queryset = UserProducts.objects.all()
     serializer_class = ProductProviderSerializer
+    pagination_class = ProductProviderPagination
+    search_fields = ['supplier__address', 'supplier__name']
 
-    def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-
-        # keep only some fields for list
-        data = [
-                {
-                    "id": item["id"],
-                    "supplier": item["supplier"]["name"],
-                    "address": item["supplier"]["address"],
-                    "description": item["description"],
-                    "average_rating": [p['average_rating'] for p in item['products']],  # still list per product
-                    "logo": item["supplier"]["logo"],  # ✅ single supplier logo
-                }
-
-            for item in serializer.data
-        ]
-        return Response(data)
+    def get_queryset(self):
+        queryset = UserProducts.objects.select_related('supplier__user').order_by('id')
+        if self.action == 'list':
+            # the cards only show supplier columns, including its stored rating aggregates
+            return queryset
+        return queryset.prefetch_related(Prefetch(
+            'supplier__products',
+            queryset=Product.objects.select_related('dosage_form').prefetch_related('reviews'),
+        ))
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return ProductProviderListSerializer
+        return ProductProviderSerializer
 
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -339,25 +361,15 @@ class ProductProvider(viewsets.ModelViewSet):
 
 class ProductProviderListPage(TemplateView):
     template_name = 'provider/list.html'
-
-    def get(self, request):
-        supplier = Supplier.objects.filter(user=request.user.id).first()
-        context = {
-            "logo": supplier.logo if supplier and supplier.logo else None,
-        }
-        return render(request, self.template_name, context)
  
 class ProductProviderDetailPage(View):
     template_name = 'provider/detail.html'
 
     def get(self, request, pk):
-        product = get_object_or_404(Product, pk=pk)
-        supplier = Supplier.objects.filter(user=request.user.id).first()
+        product = get_object_or_404(Product.objects.select_related('supplier'), pk=pk)
         return render(request, self.template_name, {
             'product': product,
             'supplier': product.supplier,
-            "logo": supplier.logo if supplier and supplier.logo else None,
-
         })
 
 class SupplierProfileViewSet(generics.RetrieveUpdateAPIView):
@@ -379,15 +391,8 @@ class OrderCreateView(generics.CreateAPIView):
         serializer.is_valid(raise_exception=True)
         order = serializer.save()
 
-        first_item = order.items.first()
-        supplier = first_item.product.supplier  
-        supplier_user = supplier.user
-
         # Send notification
-        Notification.objects.create(
-            recipient=supplier_user,
-            message=f"You have a new order from {order.customer_full_name}."
-        )
+        notify(order.supplier.user_id, f"You have a new order from {order.customer_full_name}.")
 
         return Response(
             {
@@ -402,14 +407,14 @@ class UserOrdersListView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Order.objects.filter(supplier=self.request.user.id,is_active=True)
+        return Order.objects.filter(supplier=self.request.user.id,is_active=True).prefetch_related('items__product__dosage_form')
     
 class UserOrderDetailUpdateView(generics.RetrieveUpdateAPIView):
     serializer_class = SupplierOrderSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Order.objects.filter(supplier=self.request.user.id)
+        return Order.objects.filter(supplier=self.request.user.id).prefetch_related('items__product__dosage_form')
     
 class SupplierOrderPage(LoginRequiredMixin, TemplateView):
     login_url = '/user/signup/'
@@ -427,123 +432,56 @@ class SupplierOrderDetailPage(LoginRequiredMixin,View):
 class ProductBulkUploadView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
-    FIELD_ALIASES = {
-        "name": ["name", "product name", "product_name"],
-        "strength": ["strength", "dose"],
-        "expire_date": ["expire_date", "expiry", "expire date", "expiry date", "expiration date"],
-        "price": ["price", "cost", "unit price"],
-        "stock_quantity": ["stock_quantity", "stock quantity", "quantity", "stock", "stock qty"],
-        "dosage_form_id": ["dosage_form_id", "dosage", "dosage form", "form"],
-    }
-
-    def normalize_headers(self, headers):
-        normalized = {}
-        for h in headers:
-            if not h:
-                continue
-            h_lower = str(h).strip().lower()
-            for field, aliases in self.FIELD_ALIASES.items():
-                if h_lower in [a.lower() for a in aliases]:
-                    normalized[h] = field
-                    break
-        return normalized
-
-    def resolve_dosage_form(self, value):
-        if not value:
-            return None
-        value = str(value).strip()
-        try:
-            return DosageForm.objects.get(name__iexact=value)  # return object
-        except DosageForm.DoesNotExist:
-            return None
+    FIELD_ALIASES = ProductImporter.FIELD_ALIASES
 
     def post(self, request, *args, **kwargs):
         excel_file = request.FILES.get("file")
         if not excel_file:
             return Response({"error": "No file uploaded"}, status=status.HTTP_400_BAD_REQUEST)
 
-        file_path = default_storage.save("tmp/products.xlsx", excel_file)
-        abs_path = default_storage.path(file_path)
-
-        created_count = 0
-        updated_count = 0
-        errors = []
-
-        try:
-            wb = openpyxl.load_workbook(abs_path)
-            sheet = wb.active
-            supplier = get_object_or_404(Supplier, user=request.user)
-
-            headers = [cell.value for cell in sheet[1]]
-            header_map = self.normalize_headers(headers)
-
-            for i, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
-                try:
-                    raw_row = dict(zip(headers, row))
-                    row_data = {header_map.get(k): v for k, v in raw_row.items() if header_map.get(k)}
-
-                    # Validate required fields (None or empty string is missing)
-                    missing = [f for f in ["name", "strength", "price", "stock_quantity", "dosage_form_id"]
-                               if row_data.get(f) in [None, ""]]
-                    if missing:
-                        errors.append(f"Row {i}: Missing required fields: {', '.join(missing)}")
-                        continue
-
-                    dosage_form = self.resolve_dosage_form(row_data["dosage_form_id"])
-                    if not dosage_form:
-                        errors.append(f"Row {i}: Invalid dosage form '{row_data['dosage_form_id']}'")
-                        continue
-
-                    # Parse expire_date
-                    expire_date = None
-                    if row_data.get("expire_date"):
-                        try:
-                            expire_date = parser.parse(str(row_data["expire_date"])).date()
-                        except Exception:
-                            errors.append(f"Row {i}: Invalid date format '{row_data['expire_date']}'")
-                            continue
-
-                    # Try update first
-                    product = Product.objects.filter(
-                        name=str(row_data.get("name")).strip(),
-                        strength=str(row_data.get("strength")).strip(),
-                        dosage_form=dosage_form,
-                        supplier=supplier,
-                    ).first()
-
-                    if product:
-                        product.stock_quantity = row_data.get("stock_quantity")
-                        product.price = row_data.get("price")
-                        product.expire_date = expire_date
-                        product.save()
-                        updated_count += 1
-                    else:
-                        Product.objects.create(
-                            product_id=str(uuid.uuid4()),
-                            name=str(row_data.get("name")).strip(),
-                            strength=str(row_data.get("strength")).strip(),
-                            expire_date=expire_date,
-                            price=row_data.get("price"),
-                            stock_quantity=row_data.get("stock_quantity"),
-                            dosage_form=dosage_form,
-                            supplier=supplier,
-                        )
-                        created_count += 1
-
-                except Exception as e:
-                    errors.append(f"Row {i}: {str(e)}")
-
-        finally:
-            default_storage.delete(file_path)
+        supplier = get_object_or_404(Supplier, user=request.user)
+        job = ImportJob.objects.create(supplier=supplier, file=excel_file)
 
         return Response(
             {
-                "message": f"Imported {created_count} new products, Updated {updated_count} existing products",
-                "errors": errors,
+                "message": "Upload received, products are being imported",
+                "job_id": job.id,
+                "status_url": reverse('landing:product-bulk-upload-status', kwargs={'pk': job.id}),
             },
-            status=status.HTTP_201_CREATED,
+            status=status.HTTP_202_ACCEPTED,
         )
+
+
+class ImportJobStatusAPIView(generics.RetrieveAPIView):
+    serializer_class = ImportJobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return ImportJob.objects.filter(supplier__user=self.request.user)
     
+class SupplierExportView(LoginRequiredMixin, View):
+    """Download the signed-in supplier's `rows(supplier)` under `columns` as CSV or XLSX."""
+    login_url = '/user/signup/'
+    columns = None
+    rows = None
+    basename = None
+
+    def get(self, request, file_format):
+        if file_format not in CONTENT_TYPES:
+            raise Http404("Unsupported export format")
+        supplier = get_object_or_404(Supplier, user=request.user)
+        return export_response(self.columns, self.rows(supplier), self.basename, file_format)
+
+class ProductExportView(SupplierExportView):
+    columns = PRODUCT_COLUMNS
+    rows = staticmethod(product_rows)
+    basename = 'products'
+
+class OrderExportView(SupplierExportView):
+    columns = ORDER_COLUMNS
+    rows = staticmethod(order_rows)
+    basename = 'orders'
+
 class ContactUsViewSet(viewsets.ModelViewSet):
     queryset = ContactUs.objects.all()
     serializer_class = ContactUsSerializer
@@ -553,27 +491,17 @@ class ContactUsViewSet(viewsets.ModelViewSet):
 class FAQView(TemplateView):
     template_name = 'faq.html'
 
-    def get(self,request):
-        if request.user.is_authenticated:
-            supplier = get_object_or_404(Supplier,user=self.request.user)
-            context = {
-            'logo' : supplier.logo
-            }
-
-            return render(request,self.template_name,context)
-        return render(request,self.template_name)
-
 
 def handler404(request, exception):
     return render(request, '404.html', status=404)
 
 
 def robots_txt(request):
-    content = """
+    content = f"""
     User-agent: *
     Disallow: /admin/
     Allow: /
-    Sitemap: http://127.0.0.1:8000/sitemap.xml
+    Sitemap: {settings.SITE_URL}{reverse('sitemap')}
     """
     return HttpResponse(content, content_type="text/plain")
 
@@ -584,9 +512,9 @@ import json
 from .tasks import post_next_supplier_products
 
 def google_calendar_webhook(request):
-    # Call your function here
-    post_next_supplier_products()
-    return HttpResponse("Task executed successfully", status=200)
+    # Queue the run and answer at once; a worker does the database scan and Telegram calls
+    result = post_next_supplier_products.delay()
+    return JsonResponse({"task_id": result.id, "status": "queued"}, status=202)
 
 
 